@@ -1,27 +1,58 @@
+import atexit
 import os
+from typing import Dict, Optional
+from experiment_suite.experiment_utils import streams
+from experiment_suite import status_index
 
 class Manager:
 
-    def __init__(self, run_dir: str):
+    def __init__(
+            self,
+            run_dir: str,
+            stream_flush_size: int = 1024,
+            stream_flush_interval: float = 10.0,
+    ):
         self._progress_file = os.path.join(run_dir, 'progress.txt')
         self._spun_up_file = os.path.join(run_dir, 'spun_up.txt')
         self._stream_dir = os.path.join(run_dir, 'stream_data')
+        # runs launched by the scheduler live in <data_dir>/<xid>/<run_num> and report to the xid's status index.
+        run_dir = os.path.normpath(run_dir)
+        self._xid_dir = os.path.dirname(run_dir)
+        run_name = os.path.basename(run_dir)
+        self._run_num = int(run_name) if run_name.isnumeric() else None
+        self._stream_flush_size = stream_flush_size
+        self._stream_flush_interval = stream_flush_interval
+        self._streams: Dict[str, streams.StreamWriter] = dict()
         self._track_pid(run_dir)
+        atexit.register(self.flush)
 
     def _track_pid(self, run_dir: str):
         pid = os.getpid()
         with open(os.path.join(run_dir, 'pid.txt'), 'w') as f:
             f.write(str(pid))
 
-    def log(self, key: str, value: float) -> None:
-        data_path = os.path.join(self._stream_dir, key+'.txt')
-        with open(data_path, 'a') as f:
-            f.write(f'{value}\n')
+    def log(self, key: str, value: float, step: Optional[int] = None) -> None:
+        # values are buffered in memory and written in bulk, see streams.StreamWriter.
+        if key not in self._streams:
+            data_path = os.path.join(self._stream_dir, key + streams.STREAM_SUFFIX)
+            self._streams[key] = streams.StreamWriter(
+                data_path, self._stream_flush_size, self._stream_flush_interval)
+        self._streams[key].append(value, step)
+
+    def flush(self) -> None:
+        for stream in self._streams.values():
+            stream.flush()
+
+    def _update_status_index(self, **status) -> None:
+        if self._run_num is not None and status_index.exists(self._xid_dir):
+            status_index.update(self._xid_dir, self._run_num, **status)
 
     def set_progress(self, progress: float) -> None:
         with open(self._progress_file, 'w') as f:
             f.write(str(progress))
+        self._update_status_index(progress=progress)
 
     def mark_as_spun_up(self) -> None:
         with open(self._spun_up_file, 'w') as f:
             f.write(str(1))
+        self._update_status_index(spun_up=True)
@@ -0,0 +1,50 @@
+import os
+from typing import List
+import numpy as np
+from experiment_suite.experiment_utils import streams
+
+STREAM_DTYPE = np.dtype([('step', '<i8'), ('time', '<f8'), ('value', '<f8')])
+
+
+def _load_binary_stream(path: str) -> np.ndarray:
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version = streams.HEADER.unpack_from(data, 0)
+    if magic != streams.MAGIC or version != streams.VERSION:
+        raise Exception(f'{path} is not a version {streams.VERSION} stream file.')
+    chunks = []
+    offset = streams.HEADER.size
+    while offset + streams.CHUNK_HEADER.size <= len(data):
+        n, = streams.CHUNK_HEADER.unpack_from(data, offset)
+        offset += streams.CHUNK_HEADER.size
+        if offset + STREAM_DTYPE.itemsize * n > len(data):
+            break
+        chunk = np.empty(n, dtype=STREAM_DTYPE)
+        for i, name in enumerate(['step', 'time', 'value']):
+            chunk[name] = np.frombuffer(data, dtype=STREAM_DTYPE[name], count=n, offset=offset + 8 * n * i)
+        chunks.append(chunk)
+        offset += STREAM_DTYPE.itemsize * n
+    return np.concatenate(chunks) if chunks else np.empty(0, dtype=STREAM_DTYPE)
+
+
+def _load_text_stream(path: str) -> np.ndarray:
+    # streams logged before the binary format: one value per line, no steps or timestamps.
+    values = np.loadtxt(path, dtype=np.float64, ndmin=1)
+    stream = np.empty(len(values), dtype=STREAM_DTYPE)
+    stream['step'] = np.arange(len(values))
+    stream['time'] = np.nan
+    stream['value'] = values
+    return stream
+
+
+def list_streams(run_dir: str) -> List[str]:
+    stream_dir = os.path.join(run_dir, 'stream_data')
+    return sorted(set(os.path.splitext(name)[0] for name in os.listdir(stream_dir)))
+
+
+def load_stream(run_dir: str, key: str) -> np.ndarray:
+    stream_dir = os.path.join(run_dir, 'stream_data')
+    binary_path = os.path.join(stream_dir, key + streams.STREAM_SUFFIX)
+    if os.path.isfile(binary_path):
+        return _load_binary_stream(binary_path)
+    return _load_text_stream(os.path.join(stream_dir, key + '.txt'))
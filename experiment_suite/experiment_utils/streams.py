@@ -0,0 +1,58 @@
+import os
+import struct
+import time
+from array import array
+from typing import Optional
+
+'''
+stream_data/<key>.stream : header (magic, format version) followed by columnar chunks.
+-- each chunk : n (u32), then n steps (i64), n timestamps (f64) and n values (f64), little endian.
+A chunk torn by a crash is ignored by readers.
+'''
+
+MAGIC = b'STRM'
+VERSION = 1
+HEADER = struct.Struct('<4sI')
+CHUNK_HEADER = struct.Struct('<I')
+STREAM_SUFFIX = '.stream'
+
+
+class StreamWriter:
+
+    def __init__(
+            self,
+            path: str,
+            flush_size: int = 1024,
+            flush_interval: float = 10.0,
+    ):
+        self._path = path
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._steps = array('q')
+        self._times = array('d')
+        self._values = array('d')
+        self._next_step = 0
+        self._last_flush = time.time()
+        if not os.path.isfile(path):
+            with open(path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION))
+
+    def append(self, value: float, step: Optional[int] = None) -> None:
+        now = time.time()
+        step = self._next_step if step is None else step
+        self._next_step = step + 1
+        self._steps.append(step)
+        self._times.append(now)
+        self._values.append(value)
+        if len(self._values) >= self._flush_size or now - self._last_flush >= self._flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.time()
+        if not self._values:
+            return
+        chunk = b''.join([CHUNK_HEADER.pack(len(self._values)),
+                          self._steps.tobytes(), self._times.tobytes(), self._values.tobytes()])
+        with open(self._path, 'ab') as f:
+            f.write(chunk)
+        self._steps, self._times, self._values = array('q'), array('d'), array('d')
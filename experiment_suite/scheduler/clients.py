@@ -0,0 +1,270 @@
+import concurrent.futures
+import os
+import subprocess
+import threading
+import time
+import uuid
+import weakref
+from typing import Dict, IO, Iterable, List, Mapping, Tuple, Union
+
+import paramiko
+
+
+FileContents = Union[bytes, str]
+
+
+def _to_bytes(contents: FileContents) -> bytes:
+    return contents.encode() if isinstance(contents, str) else contents
+
+
+def _temp_path(path: str) -> str:
+    # written next to the destination so the rename stays on one filesystem.
+    return f'{path}.{uuid.uuid4().hex}.tmp'
+
+
+def sftp_path(path: str) -> str:
+    # sftp resolves relative paths against the home directory and does not expand ~.
+    return path[2:] if path.startswith('~/') else path
+
+
+def sftp_put_files(sftp: paramiko.SFTPClient, files: Mapping[str, FileContents], mode: int = 0o644) -> None:
+    for path, contents in files.items():
+        path = sftp_path(path)
+        temp_path = _temp_path(path)
+        try:
+            with sftp.open(temp_path, 'wb') as f:
+                f.set_pipelined(True)
+                f.write(_to_bytes(contents))
+            sftp.chmod(temp_path, mode)
+            sftp.posix_rename(temp_path, path)
+        except Exception:
+            try:
+                sftp.remove(temp_path)
+            except IOError:
+                pass
+            raise
+
+
+def sftp_get_file(sftp: paramiko.SFTPClient, path: str) -> bytes:
+    with sftp.open(sftp_path(path), 'rb') as f:
+        f.prefetch()
+        return f.read()
+
+
+class ClientWrapper:
+
+    def exec_command(self, command: str) -> Tuple[IO, IO, IO]:
+        raise NotImplementedError
+
+    def connect(self) -> None:
+        pass
+
+    def put_files(self, files: Mapping[str, FileContents], mode: int = 0o644) -> None:
+        # each file is written to a temporary name and renamed into place, readers never see a partial file.
+        raise NotImplementedError
+
+    def put_file(self, path: str, contents: FileContents, mode: int = 0o644) -> None:
+        self.put_files({path: contents}, mode)
+
+    def get_file(self, path: str) -> bytes:
+        raise NotImplementedError
+
+
+class ParamikoClient(ClientWrapper):
+
+    def __init__(
+            self,
+            user: str,
+            machine_address: str,
+            timeout: int = 10,
+            keepalive_interval: float = 15,
+            max_channels_per_connection: int = 8,
+            min_backoff: float = 1,
+            max_backoff: float = 60,
+            lazy: bool = False,
+    ):
+        # commands share one ssh connection per host until it holds max_channels_per_connection open
+        # channels (sshd's MaxSessions defaults to 10), after which another connection is opened.
+        # a dead connection is replaced on the next command, reconnects back off exponentially.
+        self._user = user
+        self._machine_address = machine_address
+        self._timeout = timeout
+        self._keepalive_interval = keepalive_interval
+        self._max_channels_per_connection = max_channels_per_connection
+        self._min_backoff = min_backoff
+        self._max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._connections: List[paramiko.SSHClient] = []
+        self._channels: Dict[paramiko.SSHClient, weakref.WeakSet] = dict()
+        self._capacity: Dict[paramiko.SSHClient, int] = dict()
+        self._failures = 0
+        self._next_attempt = 0.0
+        if not lazy:
+            self.connect()
+
+    def _open_connection(self) -> paramiko.SSHClient:
+        now = time.monotonic()
+        if now < self._next_attempt:
+            raise ConnectionError(f'({self._machine_address}) Reconnecting in {self._next_attempt - now:.1f}s.')
+        client = paramiko.SSHClient()
+        client.load_system_host_keys()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            client.connect(hostname=self._machine_address,
+                           username=self._user,
+                           timeout=self._timeout)
+        except Exception:
+            self._failures += 1
+            self._next_attempt = now + min(self._max_backoff, self._min_backoff * 2 ** (self._failures - 1))
+            raise
+        self._failures, self._next_attempt = 0, 0.0
+        client.get_transport().set_keepalive(self._keepalive_interval)
+        self._connections.append(client)
+        self._channels[client] = weakref.WeakSet()
+        self._capacity[client] = self._max_channels_per_connection
+        return client
+
+    def _discard(self, client: paramiko.SSHClient) -> None:
+        with self._lock:
+            if client in self._connections:
+                self._connections.remove(client)
+                del self._channels[client], self._capacity[client]
+        client.close()
+
+    def _open_channels(self, client: paramiko.SSHClient) -> int:
+        return sum(1 for channel in self._channels[client] if not channel.closed)
+
+    def _acquire(self) -> paramiko.SSHClient:
+        with self._lock:
+            for client in list(self._connections):
+                transport = client.get_transport()
+                if transport is None or not transport.is_active():
+                    self._connections.remove(client)
+                    del self._channels[client], self._capacity[client]
+                    client.close()
+                elif self._open_channels(client) < self._capacity[client]:
+                    return client
+            return self._open_connection()
+
+    def _exec_on(self, client: paramiko.SSHClient, command: str) -> Tuple[IO, IO, IO]:
+        channel = client.get_transport().open_session(timeout=self._timeout)
+        with self._lock:
+            if client in self._channels:
+                self._channels[client].add(channel)
+        channel.exec_command(command)
+        return channel.makefile_stdin('wb'), channel.makefile('r'), channel.makefile_stderr('r')
+
+    def connect(self) -> None:
+        self._acquire()
+
+    def _open_sftp(self) -> paramiko.SFTPClient:
+        client = self._acquire()
+        try:
+            sftp = client.open_sftp()
+        except (paramiko.SSHException, EOFError, OSError):
+            self._discard(client)
+            client = self._acquire()
+            sftp = client.open_sftp()
+        with self._lock:
+            if client in self._channels:
+                self._channels[client].add(sftp.get_channel())
+        return sftp
+
+    def put_files(self, files: Mapping[str, FileContents], mode: int = 0o644) -> None:
+        # one sftp session carries the whole batch.
+        with self._open_sftp() as sftp:
+            sftp_put_files(sftp, files, mode)
+
+    def get_file(self, path: str) -> bytes:
+        with self._open_sftp() as sftp:
+            return sftp_get_file(sftp, path)
+
+    def exec_command(self, command: str) -> Tuple[IO, IO, IO]:
+        client = self._acquire()
+        try:
+            return self._exec_on(client, command)
+        except paramiko.ChannelException:
+            # the server refused another session on this connection, cap it where it is.
+            with self._lock:
+                if client in self._capacity:
+                    self._capacity[client] = max(1, self._open_channels(client))
+        except (paramiko.SSHException, EOFError, OSError):
+            # the connection died since it was last used.
+            self._discard(client)
+        return self._exec_on(self._acquire(), command)
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._channels.clear()
+            self._capacity.clear()
+        for client in connections:
+            client.close()
+
+
+class LocalClient(ClientWrapper):
+
+    def exec_command(self, command: str) -> Tuple[IO, IO, IO]:
+        p = subprocess.Popen(command,
+                             shell=True,
+                             stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE,
+                             executable='/bin/bash')
+        return p.stdin, p.stdout, p.stderr
+
+    def put_files(self, files: Mapping[str, FileContents], mode: int = 0o644) -> None:
+        for path, contents in files.items():
+            path = os.path.expanduser(path)
+            temp_path = _temp_path(path)
+            try:
+                with open(temp_path, 'wb') as f:
+                    f.write(_to_bytes(contents))
+                os.chmod(temp_path, mode)
+                os.replace(temp_path, path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+    def get_file(self, path: str) -> bytes:
+        with open(os.path.expanduser(path), 'rb') as f:
+            return f.read()
+
+
+def connect_parallel(
+        clients: Mapping[str, ClientWrapper],
+        timeout: float = 30,
+) -> Dict[str, Exception]:
+    # one handshake's worth of wall time for the whole cluster. returns the hosts that failed.
+    if not clients:
+        return dict()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(clients))
+    future_to_addr = {executor.submit(client.connect): addr for addr, client in clients.items()}
+    done, not_done = concurrent.futures.wait(future_to_addr, timeout=timeout)
+    executor.shutdown(wait=False)
+    errors = {future_to_addr[future]: future.exception() for future in done if future.exception() is not None}
+    for future in not_done:
+        errors[future_to_addr[future]] = TimeoutError(f'No connection within {timeout}s.')
+    return errors
+
+
+
+def put_files_across_machines(
+        files: Mapping[str, FileContents],
+        machines: Iterable[Tuple[str, ClientWrapper]],
+        mode: int = 0o644,
+        timeout: float = 60,
+) -> Dict[str, Exception]:
+    # copies the same files to every machine side by side. returns the machines that failed.
+    machines = list(machines)
+    if not machines:
+        return dict()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(machines))
+    future_to_addr = {executor.submit(client.put_files, files, mode): addr for addr, client in machines}
+    done, not_done = concurrent.futures.wait(future_to_addr, timeout=timeout)
+    executor.shutdown(wait=False)
+    errors = {future_to_addr[future]: future.exception() for future in done if future.exception() is not None}
+    for future in not_done:
+        errors[future_to_addr[future]] = TimeoutError(f'Transfer not finished within {timeout}s.')
+    return errors
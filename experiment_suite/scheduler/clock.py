@@ -0,0 +1,20 @@
+import time
+from typing import List
+
+from experiment_suite.scheduler import events
+
+
+class Clock:
+    # the scheduler reads time and waits only through its clock, so a simulation can swap in virtual time.
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def wait(self, scheduler_events: events.SchedulerEvents, timeout: float) -> List[str]:
+        return scheduler_events.wait(timeout)
+
+
+SYSTEM_CLOCK = Clock()
@@ -0,0 +1,43 @@
+import threading
+from typing import List, Optional, Tuple, Union
+
+# remote executables report events to the scheduler as lines on their stdout.
+_EVENT_PREFIX = 'EVENT '
+
+SPUN_UP = 'spun_up'
+FINISHED = 'finished'
+RUN_EXITED = 'run_exited'
+RESOURCES_FREED = 'resources_freed'
+SUBMITTED = 'submitted'
+
+
+def format_event(name: str, *args: str) -> str:
+    return _EVENT_PREFIX + ' '.join([name, *args])
+
+
+def parse_event(line: Union[str, bytes]) -> Optional[Tuple[str, List[str]]]:
+    if isinstance(line, bytes):
+        line = line.decode(errors='replace')
+    if not line.startswith(_EVENT_PREFIX):
+        return None
+    name, *args = line[len(_EVENT_PREFIX):].split()
+    return name, args
+
+
+class SchedulerEvents:
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending: List[str] = []
+
+    def notify(self, reason: str) -> None:
+        with self._condition:
+            self._pending.append(reason)
+            self._condition.notify_all()
+
+    def wait(self, timeout: float) -> List[str]:
+        # returns the reasons that woke us, or an empty list if the fallback timer ran out.
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending, timeout=timeout)
+            reasons, self._pending = self._pending, []
+        return reasons
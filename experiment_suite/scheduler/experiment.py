@@ -0,0 +1,207 @@
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+from experiment_suite import status_index
+from experiment_suite.scheduler import clock as clock_lib
+from experiment_suite.scheduler import footprint
+from experiment_suite.scheduler import run_file_utils
+from experiment_suite.scheduler.placement import ResourceLedger
+from experiment_suite.scheduler.utils import Run
+
+RunStatus = Dict[str, Any]
+
+
+@dataclass
+class LaunchedRun:
+    idx: int
+    addr: str
+    launched_at: float
+    # the status an earlier attempt left behind, which its host may go on reporting.
+    stale_status: Optional[RunStatus] = None
+
+
+class Experiment:
+    # scheduling state of one submitted run file (one xid).
+
+    def __init__(
+            self,
+            run_file: str,
+            priority: int = 0,
+            weight: float = 1.0,
+            learn_footprints: bool = True,
+            max_attempts: int = 3,
+            retry_backoff: float = 30,
+            max_retry_backoff: float = 30 * 60,
+            clock: clock_lib.Clock = clock_lib.SYSTEM_CLOCK,
+            ledger: Optional[ResourceLedger] = None,
+    ):
+        # priority: experiments with higher priority are offered free resources first.
+        # weight: experiments of equal priority share machines in proportion to their weights.
+        # max_attempts: launches a run gets before it is marked failed for good. a failed run waits
+        # retry_backoff seconds before its first retry, doubling per attempt up to max_retry_backoff.
+        # ledger: where the scheduler reserves resources for launched runs, released as they end.
+        if weight <= 0:
+            raise Exception(f'Experiment weight must be positive, got {weight}.')
+        self.run_file = run_file
+        self.run_queue = run_file_utils.open_run_queue(run_file)
+        run_file_data = self.run_queue.metadata
+        self.xid: int = run_file_data['xid']
+        self.user_plus_machines: List[str] = run_file_data['user_plus_machines']
+        self.machines: Set[str] = {upm.split('@')[1] for upm in self.user_plus_machines}
+        self.github_ssh_link: str = run_file_data['github_ssh_link']
+        self.git_commit: Optional[str] = run_file_data.get('git_commit')
+        self.data_dir: str = run_file_data['data_dir']
+        self.experiments_dir: str = run_file_data['experiments_dir']
+        self.priority = priority
+        self.weight = weight
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self._clock = clock
+        self._ledger = ResourceLedger() if ledger is None else ledger
+        self.submitted_at = clock.time()
+        self.status_version = 0
+        self.run_status: Dict[int, RunStatus] = dict()
+        # runs this scheduler launched that have not reported finishing, the experiment's current share.
+        self.active: Set[int] = set()
+        self.launched: Dict[int, LaunchedRun] = dict()
+        # runs whose run_wrapper channel closed without a result, and when that was noticed.
+        self.suspects: Dict[int, float] = dict()
+        # runs still alive after their channel dropped, their result has to come from the status.
+        self.orphans: Set[int] = set()
+        self.retry_at: Dict[int, float] = dict()
+        self.avoid_hosts: Dict[int, Set[str]] = dict()
+        self._footprints = footprint.FootprintEstimator() if learn_footprints else None
+        # candidates are offered every cycle until launched, so their built runs are kept, and sized
+        # again only when finished runs have moved the footprint estimates.
+        self._candidates: Dict[int, Run] = dict()
+        self._sized_candidates: Dict[int, Run] = dict()
+        self._sized_with: Optional[Tuple[Optional[int], Optional[int]]] = None
+
+    @property
+    def xid_dir(self) -> str:
+        return os.path.join(os.path.expanduser(self.data_dir), str(self.xid))
+
+    def has_local_index(self) -> bool:
+        return status_index.exists(self.xid_dir)
+
+    def refresh_from_index(self) -> None:
+        # the data dir is shared, so the index is read here and only for what changed.
+        self.status_version, changed = status_index.read(self.xid_dir, since=self.status_version)
+        self.update_status(changed, self.xid_dir)
+
+    def _is_stale(self, run_num: int, info: RunStatus) -> bool:
+        return (launched := self.launched.get(run_num)) is not None and info == launched.stale_status
+
+    def update_status(self, changed: Mapping[int, RunStatus], xid_dir: Optional[str] = None) -> None:
+        changed = {run_num: info for run_num, info in changed.items() if not self._is_stale(run_num, info)}
+        self.run_status.update(changed)
+        # results of launched runs arrive as run_wrapper events. the status can still report a
+        # previous attempt, so it is only trusted for orphans, which are known to be past populating.
+        for run_num in self.orphans & set(changed):
+            if (progress := changed[run_num]['progress']) == 1:
+                self.finish_run(run_num)
+            elif progress == -1:
+                self.fail_run(run_num, 'failed after losing its channel')
+        self._record_footprints(xid_dir, changed)
+
+    def record_launch(self, idx: int, run_num: int, addr: str) -> None:
+        self.run_queue.mark_scheduled(idx)
+        self._candidates.pop(idx, None)
+        self._sized_candidates.pop(idx, None)
+        self.active.add(run_num)
+        # a retry's reservation must not be released on what the failed attempt reported.
+        self.launched[run_num] = LaunchedRun(idx=idx, addr=addr, launched_at=self._clock.time(),
+                                             stale_status=self.run_status.pop(run_num, None))
+        self.retry_at.pop(idx, None)
+
+    def _forget(self, run_num: int) -> Optional[LaunchedRun]:
+        # whatever way a run ended, e.g. vanishing with its host, it no longer holds its host's resources.
+        self._ledger.release(self.xid, run_num)
+        self.active.discard(run_num)
+        self.suspects.pop(run_num, None)
+        self.orphans.discard(run_num)
+        return self.launched.pop(run_num, None)
+
+    def finish_run(self, run_num: int) -> None:
+        if (launched := self._forget(run_num)) is not None:
+            self.run_queue.mark_completed(launched.idx)
+            self.avoid_hosts.pop(launched.idx, None)
+
+    def fail_run(self, run_num: int, reason: str) -> None:
+        if (launched := self._forget(run_num)) is None:
+            return
+        idx, attempts = launched.idx, self.run_queue.attempts(launched.idx)
+        if attempts >= self.max_attempts:
+            self.run_queue.mark_failed(idx)
+            self.avoid_hosts.pop(idx, None)
+            print(f'Run {run_num} of {self.xid} {reason} on {launched.addr}, giving up after {attempts} attempts.')
+            return
+        backoff = min(self.max_retry_backoff, self.retry_backoff * 2 ** (attempts - 1))
+        self.avoid_hosts.setdefault(idx, set()).add(launched.addr)
+        self.retry_at[idx] = self._clock.time() + backoff
+        self.run_queue.requeue(idx)
+        print(f'Run {run_num} of {self.xid} {reason} on {launched.addr}, '
+              f'retrying in {backoff:.0f}s (attempt {attempts + 1} of {self.max_attempts}).')
+
+    def is_ready(self, idx: int, now: float) -> bool:
+        return self.retry_at.get(idx, 0) <= now
+
+    def ready_since(self, idx: int) -> float:
+        # when the run could first have been dispatched: on submission, or once its retry backoff ran out.
+        return max(self.submitted_at, self.retry_at.get(idx, 0))
+
+    def run_dir(self, run_num: int) -> str:
+        return os.path.join(self.data_dir, str(self.xid), str(run_num))
+
+    def _record_footprints(self, xid_dir: Optional[str], changed: Mapping[int, RunStatus]) -> None:
+        # get_xid_info attaches peaks to finished runs, with a local index they are read here.
+        if self._footprints is None:
+            return
+        for run_num, info in changed.items():
+            if info['progress'] != 1 or run_num in self._footprints:
+                continue
+            if 'peak_ram' in info:
+                peaks = (info['peak_ram'], info['peak_gpu_ram'])
+            elif xid_dir is not None:
+                peaks = footprint.read(os.path.join(xid_dir, str(run_num)))
+            else:
+                peaks = None
+            if peaks is not None:
+                self._footprints.add(run_num, *peaks)
+
+    def size_run(self, run: Run) -> Run:
+        # admit runs at what similar runs actually used, the sweep file's sizes stay the upper bound.
+        return run if self._footprints is None else self._footprints.size(run)
+
+    def candidate(self, idx: int) -> Run:
+        if self._footprints is not None and self._footprints.estimates != self._sized_with:
+            self._sized_candidates.clear()
+            self._sized_with = self._footprints.estimates
+        if (sized := self._sized_candidates.get(idx)) is None:
+            if (run := self._candidates.get(idx)) is None:
+                run = self._candidates[idx] = self.run_queue.get(idx)
+            sized = self._sized_candidates[idx] = self.size_run(run)
+        return sized
+
+    def blocking_hosts(self) -> Set[str]:
+        self._ledger.release_reported(self.xid, self.run_status)
+        # runs we launched are covered by a reservation, only unaccounted ones block.
+        return {run_data['hostname'] for run_num, run_data in self.run_status.items()
+                if not run_data['spun_up'] and not self._ledger.is_reserved(self.xid, run_num)}
+
+    def is_finished(self) -> bool:
+        # runs still going may fail and be requeued.
+        return self.run_queue.is_finished() and not self.active
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'xid': self.xid,
+            'run_file': self.run_file,
+            'priority': self.priority,
+            'weight': self.weight,
+            'runs': len(self.run_queue),
+            'pending': self.run_queue.num_pending,
+            'active': len(self.active),
+        }
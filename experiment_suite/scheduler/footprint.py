@@ -0,0 +1,155 @@
+import dataclasses
+import os
+import subprocess
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from experiment_suite.scheduler.utils import Run
+
+'''
+<data_dir>/<xid>/<run_num>/footprint.txt : "<peak_ram> <peak_gpu_ram>" in bytes, written by run_wrapper.
+peak_gpu_ram is "-" when the host could not report per-process gpu memory.
+'''
+
+FOOTPRINT_FILE = 'footprint.txt'
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def _process_tree(root_pid: int) -> Set[int]:
+    children: Dict[int, List[int]] = dict()
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # the command name may contain spaces, the fields after it do not.
+        ppid = int(stat[stat.rindex(b')') + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    tree, frontier = set(), [root_pid]
+    while frontier:
+        pid = frontier.pop()
+        tree.add(pid)
+        frontier.extend(children.get(pid, []))
+    return tree
+
+
+def _tree_rss(pids: Set[int]) -> int:
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/statm', 'rb') as f:
+                total += int(f.read().split()[1]) * _PAGE_SIZE
+        except OSError:
+            continue
+    return total
+
+
+def _tree_gpu_ram(pids: Set[int]) -> Optional[int]:
+    try:
+        p = subprocess.run(['nvidia-smi', '--query-compute-apps=pid,used_memory', '--format=csv,noheader,nounits'],
+                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=10)
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return None
+    if p.returncode != 0:
+        return None
+    total = 0
+    for line in p.stdout.decode().splitlines():
+        pid, used_memory = [x.strip() for x in line.split(',')]
+        if pid.isdigit() and int(pid) in pids and used_memory.isdigit():
+            total += int(used_memory) * 1024 ** 2
+    return total
+
+
+class FootprintSampler:
+
+    def __init__(self, pid: int, interval: float = 5.0):
+        self._pid = pid
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self.peak_ram = 0
+        self.peak_gpu_ram: Optional[int] = None
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _sample_loop(self) -> None:
+        while not self._stopped.is_set():
+            pids = _process_tree(self._pid)
+            self.peak_ram = max(self.peak_ram, _tree_rss(pids))
+            if (gpu_ram := _tree_gpu_ram(pids)) is not None:
+                self.peak_gpu_ram = max(self.peak_gpu_ram or 0, gpu_ram)
+            self._stopped.wait(self._interval)
+
+    def write(self, run_path: str) -> None:
+        peak_gpu_ram = '-' if self.peak_gpu_ram is None else str(self.peak_gpu_ram)
+        with open(os.path.join(run_path, FOOTPRINT_FILE), 'w') as f:
+            f.write(f'{self.peak_ram} {peak_gpu_ram}')
+
+
+def read(run_path: str) -> Optional[Tuple[int, Optional[int]]]:
+    try:
+        with open(os.path.join(run_path, FOOTPRINT_FILE), 'r') as f:
+            peak_ram, peak_gpu_ram = f.read().split()
+    except (FileNotFoundError, ValueError):
+        return None
+    return int(peak_ram), None if peak_gpu_ram == '-' else int(peak_gpu_ram)
+
+
+class FootprintEstimator:
+
+    def __init__(
+            self,
+            percentile: float = 95,
+            headroom: float = 1.2,
+            min_samples: int = 8,
+    ):
+        # runs are admitted at the given percentile of the observed peaks of finished runs in the
+        # experiment, times headroom, and never above what the sweep file asks for.
+        self._percentile = percentile
+        self._headroom = headroom
+        self._min_samples = min_samples
+        self._peak_ram: Dict[int, int] = dict()
+        self._peak_gpu_ram: Dict[int, int] = dict()
+        self._ram_estimate: Optional[int] = None
+        self._gpu_ram_estimate: Optional[int] = None
+
+    def add(self, run_num: int, peak_ram: int, peak_gpu_ram: Optional[int]) -> None:
+        self._peak_ram[run_num] = peak_ram
+        if peak_gpu_ram is not None:
+            self._peak_gpu_ram[run_num] = peak_gpu_ram
+        self._ram_estimate = self._estimate(self._peak_ram)
+        self._gpu_ram_estimate = self._estimate(self._peak_gpu_ram)
+
+    @property
+    def estimates(self) -> Tuple[Optional[int], Optional[int]]:
+        return self._ram_estimate, self._gpu_ram_estimate
+
+    def __contains__(self, run_num: int) -> bool:
+        return run_num in self._peak_ram
+
+    def _estimate(self, peaks: Dict[int, int]) -> Optional[int]:
+        if len(peaks) < self._min_samples:
+            return None
+        return int(np.percentile(list(peaks.values()), self._percentile) * self._headroom)
+
+    def size(self, run: Run) -> Run:
+        required_ram = run.required_ram
+        if self._ram_estimate is not None:
+            required_ram = min(required_ram, self._ram_estimate)
+        required_gpu_ram = run.required_gpu_ram
+        if required_gpu_ram is not None and self._gpu_ram_estimate is not None:
+            required_gpu_ram = min(required_gpu_ram, self._gpu_ram_estimate)
+        if required_ram == run.required_ram and required_gpu_ram == run.required_gpu_ram:
+            return run
+        return dataclasses.replace(run, required_ram=required_ram, required_gpu_ram=required_gpu_ram)
@@ -0,0 +1,63 @@
+import fcntl
+import hashlib
+import os
+import subprocess
+from typing import List, Optional
+
+'''
+<mirror_root>/
+-- <sha1 of url>.git/ : bare mirror of the repository.
+-- -- fetched_xids/<xid> : marker written once the mirror has been fetched for an experiment.
+-- <sha1 of url>.lock : held exclusively while the mirror is cloned or fetched.
+'''
+
+
+def _run_git(args: List[str], cwd: Optional[str] = None) -> str:
+    p = subprocess.run(['git', *args], cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        raise Exception(f'Failed to run "git {" ".join(args)}" with error: {p.stderr.decode()}.')
+    return p.stdout.decode().strip()
+
+
+def resolve_remote_head(url: str) -> str:
+    out = _run_git(['ls-remote', url, 'HEAD'])
+    if not out:
+        raise Exception(f'Could not resolve HEAD of {url}.')
+    return out.split()[0]
+
+
+class GitMirror:
+
+    def __init__(self, root: str, url: str):
+        os.makedirs(root, exist_ok=True)
+        name = hashlib.sha1(url.encode()).hexdigest()
+        self._url = url
+        self._path = os.path.join(root, name + '.git')
+        self._lock_path = os.path.join(root, name + '.lock')
+
+    def _has_commit(self, commit: str) -> bool:
+        p = subprocess.run(['git', 'cat-file', '-e', f'{commit}^{{commit}}'], cwd=self._path,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return p.returncode == 0
+
+    def update(self, xid: int, commit: Optional[str] = None) -> None:
+        marker = os.path.join(self._path, 'fetched_xids', str(xid))
+        with open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.isdir(self._path):
+                _run_git(['clone', '-q', '--mirror', self._url, self._path])
+            elif commit is not None and self._has_commit(commit):
+                pass
+            elif commit is not None or not os.path.isfile(marker):
+                _run_git(['fetch', '-q', '--prune'], cwd=self._path)
+            os.makedirs(os.path.dirname(marker), exist_ok=True)
+            with open(marker, 'w'):
+                pass
+
+    def head(self) -> str:
+        return _run_git(['rev-parse', 'HEAD'], cwd=self._path)
+
+    def checkout(self, dest: str, commit: str) -> None:
+        # a local clone hardlinks the mirror's objects, so only the working tree is written.
+        _run_git(['clone', '-q', '--local', '--no-checkout', self._path, dest])
+        _run_git(['checkout', '-q', '--detach', commit], cwd=dest)
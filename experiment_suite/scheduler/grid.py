@@ -0,0 +1,88 @@
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+import numpy as np
+
+Primitive = Union[int, str, bool, float]
+Kwargs = Dict[str, Primitive]
+KwargFilter = Callable[[Kwargs], bool]
+# array filters see every product column at once and return a boolean mask over the rows.
+ArrayFilter = Callable[[Dict[str, np.ndarray]], np.ndarray]
+
+
+def _object_array(values: List[Primitive]) -> np.ndarray:
+    # filled one element at a time, so sequence values stay single elements instead of becoming a dimension.
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def _filter_column(values: List[Primitive]) -> np.ndarray:
+    # plain numbers and bools get a numeric column array filters can do arithmetic on quickly,
+    # anything else, e.g. strings or tuples, is handed over as the python values.
+    try:
+        column = np.asarray(values)
+    except ValueError:
+        return _object_array(values)
+    if column.shape != (len(values),) or column.dtype.kind not in 'biuf':
+        return _object_array(values)
+    return column
+
+
+class Grid:
+
+    def __init__(self, sweep_args: Dict[str, List[Primitive]]):
+        # columns are ordered by name and the last one varies fastest, matching itertools.product.
+        self._names = sorted(sweep_args.keys())
+        self._values = [_object_array(sweep_args[name]) for name in self._names]
+        # built on first use, only array filters need them.
+        self._columns: Optional[List[np.ndarray]] = None
+        self._radices = [len(sweep_args[name]) for name in self._names]
+        self.size = int(np.prod(self._radices, dtype=np.int64))
+
+    def decode(self, indices: np.ndarray) -> np.ndarray:
+        # mixed-radix decoding of run indices into one digit per column.
+        digits = np.empty((len(self._names), len(indices)), dtype=np.int64)
+        remainder = np.array(indices, dtype=np.int64)
+        for j in reversed(range(len(self._names))):
+            digits[j] = remainder % self._radices[j]
+            remainder //= self._radices[j]
+        return digits
+
+    def columns(self, digits: np.ndarray) -> Dict[str, np.ndarray]:
+        if self._columns is None:
+            self._columns = [_filter_column(values.tolist()) for values in self._values]
+        return {name: column[digits[j]] for j, (name, column) in enumerate(zip(self._names, self._columns))}
+
+    def kwargs_at(self, index: int) -> Kwargs:
+        if not 0 <= index < self.size:
+            raise IndexError(f'Run index {index} out of range for grid of size {self.size}.')
+        digits = self.decode(np.array([index]))
+        return {name: values[digits[j, 0]] for j, (name, values) in enumerate(zip(self._names, self._values))}
+
+    def iter_chunks(
+            self,
+            array_filters: List[ArrayFilter] = (),
+            filters: List[KwargFilter] = (),
+            enum_funcs: Optional[Dict[str, Callable[[int], Primitive]]] = None,
+            chunk_size: int = 65536,
+    ) -> Iterator[List[Tuple[int, Kwargs]]]:
+        enum_funcs = dict() if enum_funcs is None else enum_funcs
+        for start in range(0, self.size, chunk_size):
+            indices = np.arange(start, min(start + chunk_size, self.size), dtype=np.int64)
+            digits = self.decode(indices)
+            mask = np.ones(len(indices), dtype=bool)
+            if array_filters:
+                columns = self.columns(digits)
+                for f in array_filters:
+                    mask &= np.asarray(f(columns), dtype=bool)
+            indices, digits = indices[mask], digits[:, mask]
+            # object arrays hand back the original python values, not numpy scalars.
+            value_lists = [values[digits[j]].tolist() for j, values in enumerate(self._values)]
+            chunk = []
+            for i, row in zip(indices.tolist(), zip(*value_lists) if value_lists else [()] * len(indices)):
+                kwargs = dict(zip(self._names, row))
+                kwargs.update((name, f(i)) for name, f in enum_funcs.items())
+                if all(f(kwargs) for f in filters):
+                    chunk.append((i, kwargs))
+            if chunk:
+                yield chunk
@@ -1,9 +1,12 @@
 import argparse
 import os
+import pickle
 import re
 import tempfile
+import threading
+import time
 from enum import Enum
-from typing import Tuple, List, Union
+from typing import Tuple, List, Union, Dict, Any, Optional, Set
 
 from typing.io import TextIO
 
@@ -40,7 +43,7 @@ def get_active_tmux_sessions(
         raise Exception(f'Failed to execute "tmux ls" with error message: {err}.')
     names = []
     for line in stdout.readlines():
-        if m := re.match(r'^(\S?)\: .+$', line):
+        if m := re.match(r'^(\S+?)\: .+$', line):
             names.append(m.groups()[0])
     return names
 
@@ -57,17 +60,83 @@ def launch_tmux_named_session_with_command(
     client.exec_command(f'tmux -d -s "{session_name}" {command}')
 
 
-def move_file_to_client(
-        sweep_file_or_path: Union[str, io.TextIOBase],
-        dest_path: str,
-) -> None:
+def read_file_contents(sweep_file_or_path: Union[str, io.TextIOBase]) -> str:
     if isinstance(sweep_file_or_path, io.TextIOBase):
-        sweep_file_contents = sweep_file_or_path.read()
-    else:
-        with open(sweep_file_or_path, 'r') as f:
-            sweep_file_contents = f.read()
-    escaped_sweep_contents = sweep_file_contents.replace('"', r'\"')
-    client.exec_command(f'echo "{escaped_sweep_contents}" > {dest_path}')
+        return sweep_file_or_path.read()
+    with open(sweep_file_or_path, 'r') as f:
+        return f.read()
+
+
+def move_files_to_client(
+        client: run_scheduler.ClientWrapper,
+        files: Dict[str, Union[str, io.TextIOBase]],
+) -> None:
+    # files maps destination paths to local paths or file objects, all sent in one transfer.
+    client.put_files({dest_path: read_file_contents(f) for dest_path, f in files.items()})
+
+
+def _read_text(stdout) -> str:
+    out = stdout.read()
+    return out.decode() if isinstance(out, bytes) else out
+
+
+def probe_host(client: run_scheduler.ClientWrapper, timeout: float) -> Dict[str, Any]:
+    # monitor data and running launchers are fetched over two channels of the same connection at once.
+    _, monitor_out, _ = client.exec_command(run_scheduler.build_remote_command('get_monitor_data', []))
+    _, tmux_out, _ = client.exec_command('tmux ls 2>/dev/null')
+    for out in (monitor_out, tmux_out):
+        if hasattr(out, 'channel'):
+            out.channel.settimeout(timeout)
+    probe = dict(pickle.loads(monitor_out.read()))
+    probe['launchers'] = sum(1 for line in _read_text(tmux_out).splitlines() if line.startswith('launcher-'))
+    return probe
+
+
+def probe_hosts(
+        clients: Dict[str, run_scheduler.ClientWrapper],
+        deadline: float,
+) -> Tuple[Dict[str, Dict[str, Any]], Set[str]]:
+    # returns the probes in by the deadline and the hosts that could not be connected to.
+    # daemon threads, so a host that hangs past the deadline cannot hold up the launcher's exit.
+    probes, unreachable, lock = dict(), set(), threading.Lock()
+
+    def probe(addr: str, client: run_scheduler.ClientWrapper) -> None:
+        try:
+            client.connect()
+        except Exception as e:
+            print(f'({addr}) Could not connect: {e!r}')
+            with lock:
+                unreachable.add(addr)
+            return
+        try:
+            result = probe_host(client, deadline)
+        except Exception as e:
+            print(f'({addr}) Probe failed: {e!r}')
+            return
+        with lock:
+            probes[addr] = result
+
+    threads = [threading.Thread(target=probe, args=item, daemon=True) for item in clients.items()]
+    end = time.monotonic() + deadline
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(max(0.0, end - time.monotonic()))
+    with lock:
+        return dict(probes), set(unreachable)
+
+
+def score_host(
+        probe: Dict[str, Any],
+        min_free_mem: float = 10 * const.GB,
+        min_idle_cpu: float = 10,
+        launcher_penalty: float = 0.25,
+) -> Optional[float]:
+    # idle cpu and free ram as fractions of the machine, less a penalty per launcher already running there.
+    if probe['free_mem'] < min_free_mem or probe['idle_cpu'] < min_idle_cpu:
+        return None
+    total_mem = probe.get('total_mem', probe['free_mem'])
+    return probe['idle_cpu'] / 100 + probe['free_mem'] / total_mem - launcher_penalty * probe['launchers']
 
 
 if __name__ == '__main__':
@@ -76,6 +145,9 @@ if __name__ == '__main__':
     parser.add_argument('-sweep_file', type=str, required=True)
     parser.add_argument('--machines', type=str)
     parser.add_argument('--user', type=str)
+    # the probe deadline only narrows down which host runs the launcher.
+    parser.add_argument('--probe_timeout', type=float, default=5.0)
+    parser.add_argument('--connect_timeout', type=float, default=10.0)
 
     args = parser.parse_args()
     machine_arg_type, machine_arg = get_from_parser_or_environ(args, 'machines', 'MACHINES')
@@ -95,37 +167,26 @@ if __name__ == '__main__':
                             f'addresses. Found {len(users)} users and '
                             f'{len(machine_addresses)} machines addresses.')
 
-    # load clients
-    addrs_and_clients = []
-    client_lookup = dict()
-    user_plus_addrs = []
-    for user, addr in zip(users, machine_addresses):
-        try:
-            client = run_scheduler.ParamikoClient(user, addr, timeout=10)
-            addrs_and_clients.append((addr, client))
-            user_plus_addrs.append(f'{user}@{addr}')
-            client_lookup[addr] = client
-        except TimeoutError:
-            pass
-    data = run_scheduler.execute_across_machines('get_monitor_data',
-                                                 args=[],
-                                                 machines=addrs_and_clients)
-    selected_addr, selected_client = None, None
-    for addr, monitor_data in data.items():
-        insufficient_mem = monitor_data['free_mem'] < 10 * const.GB
-        insufficient_cpu = monitor_data['idle_cpu'] < 10
-        if insufficient_cpu or insufficient_mem:
-            selected_client = client_lookup[addr]
-            selected_addr = addr
-    if selected_client is None or selected_addr is None:
+    # probe every host at once. hosts that are merely slow stay in the machines file, the
+    # scheduler's host_timeout deals with them, only ones that refused a connection are left out.
+    clients = {addr: run_scheduler.ParamikoClient(user, addr, timeout=args.connect_timeout, lazy=True)
+               for user, addr in zip(users, machine_addresses)}
+    probes, unreachable = probe_hosts(clients, args.probe_timeout)
+    user_plus_addrs = [f'{user}@{addr}' for user, addr in zip(users, machine_addresses) if addr not in unreachable]
+    scores = {addr: score for addr, probe in probes.items() if (score := score_host(probe)) is not None}
+    if not scores:
         raise Exception('Could not find client with sufficient resources among:\n' +
                         '\n'.join([f'\t[{addr}]' for addr in machine_addresses]))
+    selected_addr = max(scores, key=scores.get)
+    selected_client = clients[selected_addr]
 
     temp_name = tempfile.gettempprefix()
-    # move the sweep file onto the machine in a temporary location.
-    move_file_to_client(args.sweep_file, f'/tmp/sweep_{temp_name}.py')
+    # move the sweep and machine files onto the machine in a temporary location.
     machine_string = '\n'.join(user_plus_addrs)
-    move_file_to_client(io.StringIO(machine_string), f'/tmp/machines_{temp_name}')
+    move_files_to_client(selected_client, {
+        f'/tmp/sweep_{temp_name}.py': args.sweep_file,
+        f'/tmp/machines_{temp_name}': io.StringIO(machine_string),
+    })
 
     # execute the sweep_file --> run_file conversion remotely
     out = run_scheduler.execute_across_machines('sweep_file_to_run_file',
@@ -134,9 +195,11 @@ if __name__ == '__main__':
     experiment_dir = out[selected_addr]['experiment_data_dir']
     xid = int(os.path.dirname(experiment_dir))
     # kick off the scheduler with the newly generated runfile.
-    run_file = os.path.join(experiment_dir, 'run_file.pickle')
+    run_file = os.path.join(experiment_dir, 'run_queue')
+    # sweeps are handed to the host's scheduler daemon, the first sweep on a host starts it.
+    scheduler_command = 'python3.8 -m experiment_suite.scheduler.run_scheduler'
     command = (
         f'pip3.8 install --upgrade -i https://test.pypi.org/simple/ crgrimm-scheduler; '
-        f'python3.8 -m experiment_suite.scheduler.run_scheduler schedule {run_file}')
+        f'{scheduler_command} submit {run_file} || {scheduler_command} daemon {run_file}')
 
     launch_tmux_named_session_with_command(selected_client, f"launcher-{xid}", command)
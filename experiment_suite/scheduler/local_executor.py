@@ -0,0 +1,151 @@
+import argparse
+import collections
+import concurrent.futures
+import os
+import time
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+from experiment_suite.scheduler import run_file_utils
+from experiment_suite.scheduler.monitors import proc_monitor
+from experiment_suite.scheduler.remote_executables import create_experiment
+from experiment_suite.scheduler.remote_executables.run_wrapper import RunWrapper
+from experiment_suite.scheduler.utils import Run
+
+'''
+Runs a whole run file on this machine, without ssh or a scheduler.
+The experiment is checked out and its environment linked once, in <experiments_dir>/<xid>_local,
+and every run uses that checkout. Runs go through RunWrapper, so run directories, the status
+index and Manager behave exactly as they do for runs launched by the scheduler.
+'''
+
+
+@dataclass
+class Slot:
+    cpus: Tuple[int, ...]
+    gpu: Optional[int]
+
+
+def make_slots(
+        num_workers: Optional[int] = None,
+        cores_per_run: Optional[int] = None,
+        gpus: Optional[List[int]] = None,
+) -> List[Slot]:
+    # each slot owns a disjoint set of cores. gpus are dealt out round robin, so slots only share
+    # a gpu when there are more slots than gpus.
+    cpus = sorted(os.sched_getaffinity(0))
+    if num_workers is None:
+        num_workers = len(cpus) // (cores_per_run or 1)
+    if cores_per_run is None:
+        cores_per_run = max(1, len(cpus) // num_workers)
+    if num_workers < 1 or num_workers * cores_per_run > len(cpus):
+        raise Exception(f'Cannot give {num_workers} runs {cores_per_run} cores each out of {len(cpus)}.')
+    return [Slot(cpus=tuple(cpus[i * cores_per_run:(i + 1) * cores_per_run]),
+                 gpu=None if not gpus else gpus[i % len(gpus)])
+            for i in range(num_workers)]
+
+
+def prepare_experiment(metadata: Dict, python_command: str = 'python3.8') -> str:
+    base_dir = os.path.expanduser(metadata['experiments_dir'])
+    project_folder = os.path.join(base_dir, f'{metadata["xid"]}_local')
+    if not os.path.isdir(project_folder):
+        os.makedirs(base_dir, exist_ok=True)
+        create_experiment.checkout_from_mirror(base_dir, project_folder, metadata['xid'],
+                                               metadata['github_ssh_link'], metadata.get('git_commit'))
+        create_experiment.link_cached_venv(base_dir, project_folder, python_command)
+    return project_folder
+
+
+def _run_in_slot(
+        run: Run,
+        experiment_base_dir: str,
+        cpus: Tuple[int, ...],
+        gpu: Optional[int],
+        attempt: int,
+) -> int:
+    # runs in a pool worker. the experiment's processes inherit the worker's cpu affinity.
+    os.sched_setaffinity(0, cpus)
+    cuda_env_var = '' if gpu is None else f'CUDA_VISIBLE_DEVICES={gpu}'
+    jax_safe_mem_var = 'XLA_PYTHON_CLIENT_PREALLOCATE=false'
+    wrapper = RunWrapper(
+        data_dir=os.path.expanduser(run.data_dir),
+        experiment_base_dir=experiment_base_dir,
+        venv_name=run.venv_name,
+        xid=run.xid,
+        run_num=run.run_num,
+        pythonpath=run.pythonpath,
+        experiment_file=run.experiment_file,
+        experiment_arg_string=run.experiment_arg_string,
+        experiment_environ_vars=','.join(
+            v for v in [run.experiment_environ_vars, cuda_env_var, jax_safe_mem_var] if v),
+        attempt=attempt,
+        remove_base_dir=False,
+    )
+    return wrapper.retcode
+
+
+class LocalExecutor:
+
+    def __init__(
+            self,
+            run_file: str,
+            num_workers: Optional[int] = None,
+            cores_per_run: Optional[int] = None,
+            gpus: Optional[List[int]] = None,
+            python_command: str = 'python3.8',
+    ):
+        self._run_queue = run_file_utils.open_run_queue(run_file)
+        self._slots = make_slots(num_workers, cores_per_run, gpus)
+        self._python_command = python_command
+        # runs are admitted while their required_ram fits in what was free when the executor started.
+        self._ram_budget = proc_monitor.ProcMonitor().get_data()['free_mem']
+
+    def run(self, wait_time: float = 5) -> None:
+        metadata = self._run_queue.metadata
+        experiment_base_dir = prepare_experiment(metadata, self._python_command)
+        os.makedirs(os.path.join(os.path.expanduser(metadata['data_dir']), str(metadata['xid'])), exist_ok=True)
+        free_slots: Deque[Slot] = collections.deque(self._slots)
+        running: Dict[concurrent.futures.Future, Tuple[int, Run, Slot]] = dict()
+        reserved_ram = 0
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(self._slots)) as executor:
+            while running or not self._run_queue.is_finished():
+                while free_slots and (idx := self._run_queue.peek_index()) is not None:
+                    run = self._run_queue.get(idx)
+                    if running and reserved_ram + run.required_ram > self._ram_budget:
+                        break
+                    # runs requeued by a scheduler keep counting their attempts.
+                    attempt = self._run_queue.attempts(idx)
+                    self._run_queue.mark_scheduled(idx)
+                    slot = free_slots.popleft()
+                    reserved_ram += run.required_ram
+                    future = executor.submit(_run_in_slot, run, experiment_base_dir, slot.cpus, slot.gpu, attempt)
+                    running[future] = (idx, run, slot)
+                if not running:
+                    # the run file is still being written.
+                    time.sleep(wait_time)
+                    continue
+                done, _ = concurrent.futures.wait(running, timeout=wait_time,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    idx, run, slot = running.pop(future)
+                    free_slots.append(slot)
+                    reserved_ram -= run.required_ram
+                    if future.exception() is None and future.result() == 0:
+                        self._run_queue.mark_completed(idx)
+                        print(f'Run {run.run_num} finished.')
+                    else:
+                        self._run_queue.mark_failed(idx)
+                        reason = future.exception() or f'exit code {future.result()}'
+                        print(f'Run {run.run_num} failed: {reason!r}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('run_file', type=str)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--cores_per_run', type=int)
+    parser.add_argument('--gpus', type=str, help='comma separated gpu indices to spread runs over.')
+    parser.add_argument('--python_command', type=str, default='python3.8')
+    args = parser.parse_args()
+    gpus = None if args.gpus is None else [int(x) for x in args.gpus.split(',')]
+    LocalExecutor(args.run_file, args.workers, args.cores_per_run, gpus, args.python_command).run()
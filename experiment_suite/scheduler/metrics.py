@@ -0,0 +1,154 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+'''
+Counters, gauges and histograms the scheduler keeps about itself, exported as a Prometheus
+text file (for node_exporter's textfile collector) or appended to a JSON lines file.
+Recording is a lock and a few dict operations, so it stays on in production.
+'''
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# seconds, from a local syscall to a slow ssh round trip.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+# seconds a run waits to be dispatched, up to a day.
+DISPATCH_BUCKETS = (1, 5, 15, 30, 60, 300, 900, 1800, 3600, 4 * 3600, 12 * 3600, 24 * 3600)
+
+
+class _Histogram:
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Iterator[Tuple[str, int]]:
+        total = 0
+        for bound, count in zip([*map(_format_number, self.buckets), '+Inf'], self.counts):
+            total += count
+            yield bound, total
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = dict()
+        self._gauges: Dict[str, Dict[Labels, float]] = dict()
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = dict()
+        self._buckets: Dict[str, Sequence[float]] = dict()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, dict())
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges.setdefault(name, dict())[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels) -> None:
+        # a histogram keeps the buckets it was first observed with.
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, dict())
+            if (histogram := series.get(key)) is None:
+                histogram = series[key] = _Histogram(self._buckets.setdefault(name, buckets))
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def time(self, name: str, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+            self._buckets.clear()
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for metric_type, metrics in [('counter', self._counters), ('gauge', self._gauges)]:
+                for name, series in sorted(metrics.items()):
+                    lines.append(f'# TYPE {name} {metric_type}')
+                    lines.extend(f'{name}{_format_labels(labels)} {_format_number(value)}'
+                                 for labels, value in sorted(series.items()))
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in sorted(series.items()):
+                    lines.extend(f'{name}_bucket{_format_labels(labels, (("le", bound),))} {count}'
+                                 for bound, count in histogram.cumulative())
+                    lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(histogram.sum)}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def to_json_lines(self, now: float) -> str:
+        # one line per series, each carrying the time of the export.
+        records: List[Dict] = []
+        with self._lock:
+            for metric_type, metrics in [('counter', self._counters), ('gauge', self._gauges)]:
+                for name, series in sorted(metrics.items()):
+                    records.extend({'time': now, 'name': name, 'type': metric_type, 'labels': dict(labels),
+                                    'value': value} for labels, value in sorted(series.items()))
+            for name, series in sorted(self._histograms.items()):
+                for labels, histogram in sorted(series.items()):
+                    records.append({'time': now, 'name': name, 'type': 'histogram', 'labels': dict(labels),
+                                    'count': histogram.count, 'sum': histogram.sum,
+                                    'buckets': dict(histogram.cumulative())})
+        return ''.join(json.dumps(record) + '\n' for record in records)
+
+    def export(self, path: str, now: float) -> None:
+        # .jsonl files grow by a snapshot per export. anything else is a Prometheus text file,
+        # replaced by a rename so the collector never reads half of one.
+        if path.endswith('.jsonl'):
+            with open(path, 'a') as f:
+                f.write(self.to_json_lines(now))
+            return
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(self.to_prometheus())
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+# what the scheduler and the helpers it runs on every host record into.
+REGISTRY = Metrics()
@@ -0,0 +1,71 @@
+import collections
+import threading
+import time
+from typing import Mapping, Optional, List, Callable, Tuple, Deque
+
+from experiment_suite.scheduler.monitors import agent as agent_lib
+
+Sample = Tuple[float, Mapping[str, float]]
+
+
+class MonitorSubscription:
+
+    def __init__(
+            self,
+            client,
+            command: str,
+            history_size: int = 600,
+    ):
+        self._client = client
+        self._command = command
+        self._history: Deque[Sample] = collections.deque(maxlen=history_size)
+        self._received_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Sample], None]] = []
+        self._alive = False
+        self.start()
+
+    def start(self) -> None:
+        try:
+            _, stdout, _ = self._client.exec_command(self._command)
+        except Exception as e:
+            print(f'Failed to subscribe to monitor agent: {e!r}')
+            return
+        self._alive = True
+        threading.Thread(target=self._read_loop, args=(stdout,), daemon=True).start()
+
+    def _read_loop(self, stdout) -> None:
+        try:
+            while line := stdout.readline():
+                sample: Sample = agent_lib.decode_line(line)
+                with self._lock:
+                    self._history.append(sample)
+                    self._received_at = time.time()
+                    listeners = list(self._listeners)
+                for listener in listeners:
+                    listener(sample)
+        except Exception as e:
+            print(f'Monitor subscription dropped: {e!r}')
+        finally:
+            self._alive = False
+
+    @property
+    def is_alive(self) -> bool:
+        return self._alive
+
+    def add_listener(self, listener: Callable[[Sample], None]) -> None:
+        with self._lock:
+            self._listeners.append(listener)
+
+    def latest(self, max_age: Optional[float] = None) -> Optional[Mapping[str, float]]:
+        with self._lock:
+            if not self._history:
+                return None
+            if max_age is not None and time.time() - self._received_at > max_age:
+                return None
+            return self._history[-1][1]
+
+    def history(self, n: Optional[int] = None) -> List[Sample]:
+        with self._lock:
+            samples = list(self._history)
+        return samples if n is None else samples[-n:]
@@ -0,0 +1,147 @@
+import base64
+import collections
+import os
+import pickle
+import queue
+import socket
+import socketserver
+import threading
+import time
+from typing import Mapping, List, Tuple, Optional, Deque, Set
+
+from experiment_suite.scheduler.monitors import monitor
+
+Sample = Tuple[float, Mapping[str, float]]
+
+# seconds after which an agent's latest sample is not trusted, a few of its default sampling intervals.
+MAX_SAMPLE_AGE = 5.0
+
+
+def socket_address() -> str:
+    # abstract namespace socket: one per user per host, even when home directories are shared over NFS.
+    return f'\0experiment_suite_monitor_agent_{os.getuid()}'
+
+
+def encode_line(obj) -> bytes:
+    return base64.b64encode(pickle.dumps(obj)) + b'\n'
+
+
+def decode_line(line: bytes):
+    return pickle.loads(base64.b64decode(line.strip()))
+
+
+class MonitorAgent:
+
+    def __init__(
+            self,
+            monitor: monitor.Monitor,
+            interval: float = 1.0,
+            history_size: int = 600,
+    ):
+        self._monitor = monitor
+        self._interval = interval
+        self._history: Deque[Sample] = collections.deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self._subscribers: Set[queue.Queue] = set()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _sample_loop(self) -> None:
+        while not self._stopped.is_set():
+            start = time.time()
+            try:
+                sample = (start, self._monitor.get_data())
+            except Exception as e:
+                # a failed sample is skipped, the next interval tries again.
+                print(f'Monitor sample failed: {e!r}')
+            else:
+                with self._lock:
+                    self._history.append(sample)
+                    subscribers = list(self._subscribers)
+                for subscriber in subscribers:
+                    subscriber.put(sample)
+            self._stopped.wait(max(0.0, self._interval - (time.time() - start)))
+
+    def latest(self) -> Optional[Sample]:
+        with self._lock:
+            return self._history[-1] if self._history else None
+
+    def history(self, n: Optional[int] = None) -> List[Sample]:
+        with self._lock:
+            samples = list(self._history)
+        return samples if n is None else samples[-n:]
+
+    def subscribe(self) -> queue.Queue:
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._history:
+                subscriber.put(self._history[-1])
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+
+class _AgentRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self) -> None:
+        agent: MonitorAgent = self.server.agent
+        request = self.rfile.readline().decode().split()
+        if not request:
+            # liveness probes connect and hang up without a command.
+            return
+        command, *args = request
+        if command == 'latest':
+            self.wfile.write(encode_line(agent.latest()))
+        elif command == 'history':
+            self.wfile.write(encode_line(agent.history(int(args[0]) if args else None)))
+        elif command == 'subscribe':
+            subscriber = agent.subscribe()
+            try:
+                while True:
+                    self.wfile.write(encode_line(subscriber.get()))
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                agent.unsubscribe(subscriber)
+        else:
+            raise Exception(f'Unknown monitor agent command "{command}".')
+
+
+class _AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(agent: MonitorAgent, address: str = None) -> None:
+    address = socket_address() if address is None else address
+    server = _AgentServer(address, _AgentRequestHandler)
+    server.agent = agent
+    agent.start()
+    try:
+        server.serve_forever()
+    finally:
+        agent.stop()
+        server.server_close()
+
+
+def connect(address: str = None, timeout: Optional[float] = None) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.connect(socket_address() if address is None else address)
+    return sock
+
+
+def request(command: str, address: str = None, timeout: float = 1.0):
+    with connect(address, timeout) as sock:
+        sock.sendall(command.encode() + b'\n')
+        with sock.makefile('rb') as f:
+            return decode_line(f.readline())
@@ -15,4 +15,5 @@ class GPUMonitor(monitor.Monitor):
         for entry in info:
             mem_free = (entry['mem_total'] - entry['mem_used']) * M
             data[f'gpu{entry["index"]}-mem-free'] = mem_free
+            data[f'gpu{entry["index"]}-mem-total'] = entry['mem_total'] * M
         return data
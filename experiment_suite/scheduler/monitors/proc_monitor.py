@@ -0,0 +1,84 @@
+import os
+import time
+from typing import Mapping, Optional, Tuple
+from experiment_suite.scheduler.monitors import monitor
+
+# /proc/stat cpu columns: user nice system idle iowait irq softirq steal (guest time is already in user).
+_NUM_CPU_FIELDS = 8
+_IDLE_FIELD = 3
+
+
+def _read_cpu_times(proc_dir: str) -> Tuple[int, int]:
+    with open(os.path.join(proc_dir, 'stat'), 'rb') as f:
+        fields = f.readline().split()[1:_NUM_CPU_FIELDS + 1]
+    times = [int(x) for x in fields]
+    return times[_IDLE_FIELD], sum(times)
+
+
+def _read_meminfo(proc_dir: str) -> Mapping[str, int]:
+    meminfo = dict()
+    with open(os.path.join(proc_dir, 'meminfo'), 'rb') as f:
+        for line in f:
+            key, value, *_ = line.split()
+            meminfo[key[:-1].decode()] = int(value) * 1024
+    return meminfo
+
+
+def _read_loadavg(proc_dir: str) -> Tuple[float, float, float]:
+    with open(os.path.join(proc_dir, 'loadavg'), 'rb') as f:
+        load_1, load_5, load_15, *_ = f.read().split()
+    return float(load_1), float(load_5), float(load_15)
+
+
+class ProcMonitor(monitor.Monitor):
+
+    def __init__(
+            self,
+            smoothing: float = 0.2,
+            min_interval: float = 0.1,
+            proc_dir: str = '/proc',
+    ):
+        # smoothing: weight of the newest sample in the rolling averages.
+        # min_interval: the first sample waits this long after construction so idle cpu covers a real interval.
+        self._smoothing = smoothing
+        self._min_interval = min_interval
+        self._proc_dir = proc_dir
+        self._num_cpus = os.cpu_count() or 1
+        self._previous_cpu_times = _read_cpu_times(proc_dir)
+        self._previous_time = time.monotonic()
+        self._idle_cpu_avg: Optional[float] = None
+        self._free_mem_avg: Optional[float] = None
+
+    def _average(self, average: Optional[float], value: float) -> float:
+        return value if average is None else (1 - self._smoothing) * average + self._smoothing * value
+
+    def _idle_cpu(self) -> float:
+        if self._idle_cpu_avg is None and (wait := self._min_interval - (time.monotonic() - self._previous_time)) > 0:
+            time.sleep(wait)
+        idle, total = _read_cpu_times(self._proc_dir)
+        previous_idle, previous_total = self._previous_cpu_times
+        self._previous_cpu_times, self._previous_time = (idle, total), time.monotonic()
+        if total == previous_total:
+            # no clock tick since the last sample, so nothing new to report.
+            return 100.0 if self._idle_cpu_avg is None else self._idle_cpu_avg
+        return 100.0 * (idle - previous_idle) / (total - previous_total)
+
+    def get_data(self) -> Mapping[str, float]:
+        idle_cpu = self._idle_cpu()
+        meminfo = _read_meminfo(self._proc_dir)
+        # MemAvailable counts reclaimable page cache, which a new run can take.
+        free_mem = meminfo.get('MemAvailable', meminfo['MemFree'])
+        load_1, load_5, load_15 = _read_loadavg(self._proc_dir)
+        self._idle_cpu_avg = self._average(self._idle_cpu_avg, idle_cpu)
+        self._free_mem_avg = self._average(self._free_mem_avg, free_mem)
+        return {
+            'idle_cpu': idle_cpu,  # percent of all cores idle since the last sample.
+            'idle_cpu_avg': self._idle_cpu_avg,
+            'free_mem': free_mem,
+            'free_mem_avg': self._free_mem_avg,
+            'total_mem': meminfo['MemTotal'],
+            'num_cpus': self._num_cpus,
+            'load_1': load_1,
+            'load_5': load_5,
+            'load_15': load_15,
+        }
@@ -0,0 +1,301 @@
+import collections
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Mapping, Any, Set, Hashable
+
+from experiment_suite.scheduler.utils import Run
+
+RunKey = Tuple[int, int]
+# identifies a candidate run across scheduling cycles, e.g. its index in the run queue.
+CandidateKey = Hashable
+
+
+@dataclass
+class Reservation:
+    addr: str
+    ram: int
+    cpus: float
+    gpu: Optional[int]
+    gpu_ram: int
+    created_at: float
+
+
+@dataclass
+class Placement:
+    run_idx: CandidateKey
+    run: Run
+    addr: str
+    gpu: Optional[int]
+
+
+class ResourceLedger:
+
+    def __init__(self, ttl: float = 30 * 60):
+        # a reservation covers a launched run until the monitors can see its footprint,
+        # i.e. until it marks itself spun up or finishes. the ttl bounds runs that never report.
+        # gpu assignments outlive reservations: they hold a run's gpu budget until it finishes,
+        # or until its reservation expires without the run ever reporting.
+        self._ttl = ttl
+        self._reservations: Dict[RunKey, Reservation] = dict()
+        self._gpu_assignments: Dict[RunKey, Reservation] = dict()
+
+    def reserve(self, run: Run, addr: str, gpu: Optional[int], now: Optional[float] = None) -> None:
+        gpu_ram = 0 if gpu is None else run.required_gpu_ram
+        created_at = time.time() if now is None else now
+        reservation = Reservation(addr=addr, ram=run.required_ram, cpus=run.required_cpus, gpu=gpu, gpu_ram=gpu_ram,
+                                  created_at=created_at)
+        self._reservations[(run.xid, run.run_num)] = reservation
+        if gpu is not None:
+            self._gpu_assignments[(run.xid, run.run_num)] = reservation
+
+    def release(self, xid: int, run_num: int) -> None:
+        self._reservations.pop((xid, run_num), None)
+        self._gpu_assignments.pop((xid, run_num), None)
+
+    def is_reserved(self, xid: int, run_num: int) -> bool:
+        return (xid, run_num) in self._reservations
+
+    def release_reported(self, xid: int, run_info: Mapping[str, Mapping[str, Any]]) -> None:
+        for run_num, info in run_info.items():
+            if info['progress'] in (-1, 1):
+                self.release(xid, int(run_num))
+            elif info['spun_up']:
+                self._reservations.pop((xid, int(run_num)), None)
+
+    def expire(self, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        for key, reservation in list(self._reservations.items()):
+            if now - reservation.created_at > self._ttl:
+                self.release(*key)
+
+    def reserved_ram(self, addr: str) -> int:
+        return sum(r.ram for r in self._reservations.values() if r.addr == addr)
+
+    def reserved_cpus(self, addr: str) -> float:
+        return sum(r.cpus for r in self._reservations.values() if r.addr == addr)
+
+    def reserved_gpu_ram(self, addr: str, gpu: int) -> int:
+        return sum(r.gpu_ram for r in self._reservations.values() if r.addr == addr and r.gpu == gpu)
+
+    def committed_gpu_ram(self, addr: str, gpu: int) -> int:
+        return sum(r.gpu_ram for r in self._gpu_assignments.values() if r.addr == addr and r.gpu == gpu)
+
+    def gpu_runs(self, addr: str, gpu: int) -> int:
+        return sum(1 for r in self._gpu_assignments.values() if r.addr == addr and r.gpu == gpu)
+
+    def __len__(self) -> int:
+        return len(self._reservations)
+
+
+@dataclass
+class _FreeResources:
+    idle_cpu: float
+    num_cpus: int
+    ram: float
+    gpu_ram: Dict[int, float]
+    gpu_total: Dict[int, float]
+    gpu_slots: Dict[int, int]
+
+
+class PlacementEngine:
+
+    def __init__(
+            self,
+            ledger: ResourceLedger,
+            min_idle_cpu: float = 10,
+            backfill_window: int = 0,
+            max_head_bypasses: int = 12,
+            max_gpu_fraction: float = 0.9,
+            spread_gpu_fraction: float = 0.5,
+            max_runs_per_gpu: int = 8,
+    ):
+        # backfill_window: how many runs past a blocked head run may be placed ahead of it (0 keeps FIFO).
+        # max_head_bypasses: cycles a blocked head may be passed over before a machine is held for it.
+        # max_gpu_fraction: share of a gpu's memory the runs packed onto it may commit between them.
+        # spread_gpu_fraction: runs asking for more than this share of a gpu are spread, smaller ones packed.
+        self._ledger = ledger
+        self._min_idle_cpu = min_idle_cpu
+        self._backfill_window = backfill_window
+        self._max_head_bypasses = max_head_bypasses
+        self._max_gpu_fraction = max_gpu_fraction
+        self._spread_gpu_fraction = spread_gpu_fraction
+        self._max_runs_per_gpu = max_runs_per_gpu
+        self._blocked_head: Optional[CandidateKey] = None
+        self._head_bypasses = 0
+        # why the candidates of the last place call went unplaced, counted per reason.
+        self.last_failures: Dict[str, int] = collections.Counter()
+
+    def _free_resources(
+            self,
+            monitor_data: Mapping[str, Mapping[str, float]],
+            blocking_machines: Set[str],
+    ) -> Dict[str, _FreeResources]:
+        free = dict()
+        for addr, resources in monitor_data.items():
+            if addr in blocking_machines:
+                continue
+            gpu_ram, gpu_total, gpu_slots = dict(), dict(), dict()
+            for key, value in resources.items():
+                if m := re.match(r'^gpu(\d+)-mem-free$', key):
+                    gpu_num = int(m.groups()[0])
+                    gpu_slots[gpu_num] = self._max_runs_per_gpu - self._ledger.gpu_runs(addr, gpu_num)
+                    gpu_ram[gpu_num] = value - self._ledger.reserved_gpu_ram(addr, gpu_num)
+                    if (total := resources.get(f'gpu{gpu_num}-mem-total')) is not None:
+                        # runs grow into their budget after spinning up, so budgets count until they finish.
+                        budget = total * self._max_gpu_fraction - self._ledger.committed_gpu_ram(addr, gpu_num)
+                        gpu_ram[gpu_num] = min(gpu_ram[gpu_num], budget)
+                        gpu_total[gpu_num] = total
+            # launched runs only show up in idle_cpu once they are busy, until then their cores are reserved.
+            num_cpus = resources.get('num_cpus', 1)
+            free[addr] = _FreeResources(
+                idle_cpu=resources['idle_cpu'] - self._cpu_share(self._ledger.reserved_cpus(addr), num_cpus),
+                num_cpus=num_cpus,
+                ram=resources['free_mem'] - self._ledger.reserved_ram(addr),
+                gpu_ram=gpu_ram,
+                gpu_total=gpu_total,
+                gpu_slots=gpu_slots,
+            )
+        return free
+
+    @staticmethod
+    def _cpu_share(cpus: float, num_cpus: int) -> float:
+        # idle_cpu is a percentage of all of a host's cores.
+        return 100.0 * cpus / max(num_cpus, 1)
+
+    def _is_large_gpu_run(self, resources: _FreeResources, gpu_num: int, required_gpu_ram: int) -> bool:
+        total = resources.gpu_total.get(gpu_num)
+        return total is None or required_gpu_ram > total * self._spread_gpu_fraction
+
+    def _place_on_gpu(self, resources: _FreeResources, required_gpu_ram: int) -> Optional[Tuple[int, float]]:
+        # returns the chosen gpu and a score, lower is better. small runs pack onto the fullest gpu
+        # that still holds them, keeping whole gpus free for large runs, which spread onto the emptiest.
+        best = None
+        for gpu_num, free_gpu_ram in resources.gpu_ram.items():
+            if free_gpu_ram <= required_gpu_ram or resources.gpu_slots[gpu_num] <= 0:
+                continue
+            large = self._is_large_gpu_run(resources, gpu_num, required_gpu_ram)
+            score = -free_gpu_ram if large else free_gpu_ram
+            if best is None or score < best[1]:
+                best = (gpu_num, score)
+        return best
+
+    def _fit(
+            self,
+            run: Run,
+            free: Dict[str, _FreeResources],
+            held_addr: Optional[str] = None,
+            machines: Optional[Set[str]] = None,
+            avoid: Optional[Set[str]] = None,
+    ) -> Optional[Tuple[str, Optional[int]]]:
+        # best fit on ram: the tightest machine that still holds the run, leaving big holes for big runs.
+        # gpu runs are matched on their gpu first, with ram only breaking ties.
+        best, best_score = None, None
+        for addr, resources in free.items():
+            if addr == held_addr or (machines is not None and addr not in machines):
+                continue
+            if avoid is not None and addr in avoid:
+                continue
+            if resources.idle_cpu <= self._min_idle_cpu or resources.ram <= run.required_ram:
+                continue
+            gpu_num, gpu_score = None, 0.0
+            if run.required_gpu_ram is not None:
+                if (gpu_fit := self._place_on_gpu(resources, run.required_gpu_ram)) is None:
+                    continue
+                gpu_num, gpu_score = gpu_fit
+            score = (gpu_score, resources.ram)
+            if best is None or score < best_score:
+                best, best_score = (addr, gpu_num), score
+        return best
+
+    def _unfit_reason(
+            self,
+            run: Run,
+            free: Dict[str, _FreeResources],
+            held_addr: Optional[str] = None,
+            machines: Optional[Set[str]] = None,
+    ) -> str:
+        # the furthest check any machine got to before turning the run away, in the order _fit checks.
+        stages = ['no_machine', 'held', 'cpu', 'ram', 'gpu']
+        furthest = 0
+        for addr, resources in free.items():
+            if machines is not None and addr not in machines:
+                continue
+            if addr == held_addr:
+                stage = 1
+            elif resources.idle_cpu <= self._min_idle_cpu:
+                stage = 2
+            elif resources.ram <= run.required_ram:
+                stage = 3
+            else:
+                stage = 4
+            furthest = max(furthest, stage)
+        return stages[furthest]
+
+    def _hold_machine_for(
+            self,
+            run: Run,
+            free: Dict[str, _FreeResources],
+            machines: Optional[Set[str]] = None,
+    ) -> Optional[str]:
+        # the machine closest to fitting the starving run stops taking backfill until the run fits.
+        eligible = [addr for addr, resources in free.items()
+                    if (run.required_gpu_ram is None or resources.gpu_ram)
+                    and (machines is None or addr in machines)]
+        if not eligible:
+            return None
+        return max(eligible, key=lambda addr: free[addr].ram)
+
+    def place(
+            self,
+            candidates: List[Tuple[CandidateKey, Run]],
+            monitor_data: Mapping[str, Mapping[str, float]],
+            blocking_machines: Set[str],
+            machines_by_xid: Optional[Mapping[int, Set[str]]] = None,
+            avoid_machines: Optional[Mapping[CandidateKey, Set[str]]] = None,
+    ) -> List[Placement]:
+        # candidates are in priority order. machines_by_xid limits each experiment to its own machines.
+        # avoid_machines lists hosts a candidate would rather not get, e.g. ones a retried run failed on.
+        free = self._free_resources(monitor_data, blocking_machines)
+        placements = []
+        self.last_failures = collections.Counter()
+        blocked_head, placed_past_head = None, False
+        held_addr, scan_limit = None, len(candidates)
+        for position, (run_idx, run) in enumerate(candidates):
+            if position >= scan_limit:
+                # past the backfill window, nothing may jump the blocked head.
+                self.last_failures['behind_head'] += len(candidates) - position
+                break
+            machines = None if machines_by_xid is None else machines_by_xid.get(run.xid)
+            avoid = None if avoid_machines is None else avoid_machines.get(run_idx)
+            fit = self._fit(run, free, held_addr, machines, avoid)
+            if fit is None and avoid:
+                fit = self._fit(run, free, held_addr, machines)
+            if fit is None:
+                self.last_failures[self._unfit_reason(run, free, held_addr, machines)] += 1
+                if blocked_head is not None:
+                    continue
+                # the first run that does not fit is the head everything else backfills around.
+                blocked_head = run_idx
+                if self._backfill_window == 0:
+                    self.last_failures['behind_head'] += len(candidates) - position - 1
+                    break
+                scan_limit = min(scan_limit, position + 1 + self._backfill_window)
+                if run_idx != self._blocked_head:
+                    self._blocked_head, self._head_bypasses = run_idx, 0
+                if self._head_bypasses >= self._max_head_bypasses:
+                    held_addr = self._hold_machine_for(run, free, machines)
+                continue
+            addr, gpu = fit
+            free[addr].ram -= run.required_ram
+            free[addr].idle_cpu -= self._cpu_share(run.required_cpus, free[addr].num_cpus)
+            if gpu is not None:
+                free[addr].gpu_ram[gpu] -= run.required_gpu_ram
+                free[addr].gpu_slots[gpu] -= 1
+            placements.append(Placement(run_idx=run_idx, run=run, addr=addr, gpu=gpu))
+            placed_past_head = placed_past_head or blocked_head is not None
+        if blocked_head is None:
+            self._blocked_head, self._head_bypasses = None, 0
+        elif placed_past_head:
+            self._head_bypasses += 1
+        return placements
@@ -1,45 +1,48 @@
 import pickle
 import os
 import sys
-import subprocess
+from typing import Optional
+from experiment_suite.scheduler import venv_cache
+from experiment_suite.scheduler import git_mirror
 
 
 def create_project_folder(
         base_dir: str,
         xid: int,
-        run_num: int
+        run_num: int,
+        attempt: int = 0,
 ) -> str:
     if not os.path.isdir(base_dir):
         os.mkdir(base_dir)
-    folder_path = os.path.join(base_dir, f'{xid}_{run_num}')
+    # an attempt that vanished with its host never removed its folder, so retries get their own.
+    folder_name = f'{xid}_{run_num}' if attempt == 0 else f'{xid}_{run_num}_{attempt}'
+    folder_path = os.path.join(base_dir, folder_name)
     if os.path.isdir(folder_path):
         raise Exception('Folder path already exists.')
     os.mkdir(folder_path)
     return folder_path
 
 
-def download_git_contents(
+def checkout_from_mirror(
+        base_dir: str,
         project_folder: str,
+        xid: int,
         github_ssh_link: str,
+        commit: Optional[str],
 ) -> None:
-    p = subprocess.Popen(f'cd {project_folder}; git clone {github_ssh_link}',
-                         shell=True, executable='/bin/bash', stderr=subprocess.PIPE)
-    if err := p.stderr.read():
-        raise Exception(f'Failed to load github project with error: {err}.')
+    mirror = git_mirror.GitMirror(os.path.join(base_dir, '.git_mirrors'), github_ssh_link)
+    mirror.update(xid, commit)
+    mirror.checkout(project_folder, mirror.head() if commit is None else commit)
 
 
-def create_venv(
+def link_cached_venv(
+        base_dir: str,
         project_folder: str,
         python_command: str,
 ) -> None:
-    command = (f'cd {project_folder}; {python_command} -m venv venv; '
-               'source venv/bin/activate; pip install -r requirements.txt')
-    p = subprocess.Popen(command, shell=True, executable='/bin/bash', stderr=subprocess.PIPE)
-    if err := p.stderr.read():
-        raise Exception(f'Failed to create virtual environment with error: {err}.')
-
-
-
+    cache = venv_cache.VenvCache(os.path.join(base_dir, '.venv_cache'))
+    env_path = cache.get(os.path.join(project_folder, 'requirements.txt'), python_command)
+    os.symlink(env_path, os.path.join(project_folder, 'venv'))
 
 
 if __name__ == '__main__':
@@ -47,8 +50,11 @@ if __name__ == '__main__':
     xid = sys.argv[2]
     run_num = sys.argv[3]
     github_ssh_link = sys.argv[4]
+    attempt = int(sys.argv[5]) if len(sys.argv) > 5 else 0
+    # runs from older run files are not pinned to a commit.
+    commit = sys.argv[6] if len(sys.argv) > 6 else None
 
-    project_folder = create_project_folder(base_dir, int(xid), int(run_num))
-    download_git_contents(project_folder, github_ssh_link)
-    create_venv(project_folder, 'python3.8')
+    project_folder = create_project_folder(base_dir, int(xid), int(run_num), attempt)
+    checkout_from_mirror(base_dir, project_folder, int(xid), github_ssh_link, commit)
+    link_cached_venv(base_dir, project_folder, 'python3.8')
     print(pickle.dumps({'experiment_dir': project_folder}, 0).decode())
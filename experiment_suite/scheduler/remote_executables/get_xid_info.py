@@ -1,7 +1,9 @@
 import pickle
-from typing import Mapping, Any
+from typing import Mapping, Any, Dict
 import os
 import sys
+from experiment_suite import status_index
+from experiment_suite.scheduler import footprint
 
 
 def get_info(run_path: str) -> Mapping[str, Any]:
@@ -18,20 +20,31 @@ def get_info(run_path: str) -> Mapping[str, Any]:
     }
 
 
-def get_all_info(data_dir: str, xid: str) -> Mapping[str, Mapping[str, Any]]:
+def add_footprint(run_path: str, run_info: Dict[str, Any]) -> None:
+    # only successful runs reached their real peak.
+    if run_info['progress'] == 1 and (peaks := footprint.read(run_path)) is not None:
+        run_info['peak_ram'], run_info['peak_gpu_ram'] = peaks
+
+
+def get_all_info(data_dir: str, xid: str, since: int = 0) -> Mapping[str, Mapping[str, Any]]:
     xid_path = os.path.join(data_dir, xid)
-    run_data = dict()
-    for run in os.listdir(xid_path):
-        if not run.isnumeric():
-            continue
-        run_path = os.path.join(xid_path, run)
-        run_info = get_info(run_path)
-        run_data[run] = run_info
+    if status_index.exists(xid_path):
+        _, statuses = status_index.read(xid_path, since)
+        run_data = {str(run_num): dict(status) for run_num, status in statuses.items()}
+    else:
+        run_data = dict()
+        for run in os.listdir(xid_path):
+            if not run.isnumeric():
+                continue
+            run_data[run] = dict(get_info(os.path.join(xid_path, run)))
+    for run, run_info in run_data.items():
+        add_footprint(os.path.join(xid_path, run), run_info)
     return run_data
 
 
 if __name__ == '__main__':
     data_dir, xid = sys.argv[1], sys.argv[2]
-    run_data = get_all_info(data_dir, xid)
+    since = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    run_data = get_all_info(data_dir, xid, since)
     decoded = pickle.dumps(run_data, 0).decode()
     print(decoded)
\ No newline at end of file
@@ -0,0 +1,52 @@
+import subprocess
+import sys
+import time
+from experiment_suite.scheduler.monitors import agent as agent_lib
+from experiment_suite.scheduler.monitors import gpu_monitor, grouped_monitor, proc_monitor
+
+
+def build_agent() -> agent_lib.MonitorAgent:
+    return agent_lib.MonitorAgent(grouped_monitor.GroupedMonitor([
+        proc_monitor.ProcMonitor(),
+        gpu_monitor.GPUMonitor()
+    ]))
+
+
+def ensure_agent_running(timeout: float = 10) -> None:
+    try:
+        agent_lib.connect(timeout=1).close()
+        return
+    except (ConnectionRefusedError, FileNotFoundError):
+        pass
+    # if two subscribers race to spawn an agent, the loser fails to bind and exits.
+    subprocess.Popen([sys.executable, '-m', __spec__.name, 'serve'],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            agent_lib.connect(timeout=1).close()
+            return
+        except (ConnectionRefusedError, FileNotFoundError):
+            time.sleep(0.1)
+    raise Exception('Monitor agent failed to start.')
+
+
+def relay_subscription() -> None:
+    ensure_agent_running()
+    with agent_lib.connect() as sock:
+        sock.sendall(b'subscribe\n')
+        with sock.makefile('rb') as f:
+            for line in f:
+                sys.stdout.buffer.write(line)
+                sys.stdout.buffer.flush()
+
+
+if __name__ == '__main__':
+    mode = sys.argv[1]
+    if mode == 'serve':
+        agent_lib.serve(build_agent())
+    elif mode == 'subscribe':
+        relay_subscription()
+    else:
+        raise Exception(f'Mode {mode} not expected. Must be either "serve" or "subscribe".')
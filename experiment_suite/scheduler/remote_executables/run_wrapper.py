@@ -1,13 +1,21 @@
 import pickle
 import os
+import re
 import subprocess
 from typing import List
 import sys
+import threading
+import time
 from experiment_suite.scheduler import utils as sched_utils
+from experiment_suite.scheduler import events
+from experiment_suite.scheduler import venv_cache
+from experiment_suite.scheduler import footprint
+from experiment_suite import status_index
 import shutil
 
 '''
 ./data_dir
+-- status.log : status of every run, see experiment_suite.status_index.
 -- run_num/
 -- -- stdout.txt : standard output
 -- -- stderr.txt : standard error output
@@ -16,9 +24,11 @@ import shutil
 -- -- spun_up.txt : file with a bit telling indicating whether a job has started using the bulk of its resources.
 -- -- host.txt : file with the address of the running machine on it.
 -- -- pid.txt : file with the pid of the run_wrapper's process.
+-- -- footprint.txt : peak ram and gpu memory of the run's processes, see experiment_suite.scheduler.footprint.
+-- -- attempt_<n>/ : everything an earlier, failed attempt n of this run left in the run directory.
 -- -- stream_data/
--- -- -- loss1.txt : text file containing floats accumulated throughout a run.
--- -- -- loss2.txt : text file containing floats accumulated throughout a run.
+-- -- -- loss1.stream : binary (step, timestamp, value) records accumulated throughout a run.
+-- -- -- loss2.stream : binary (step, timestamp, value) records accumulated throughout a run.
 '''
 
 
@@ -35,6 +45,8 @@ class RunWrapper:
             experiment_file: str,
             experiment_arg_string: str,
             experiment_environ_vars: str,
+            attempt: int = 0,
+            remove_base_dir: bool = True,
     ):
         self._run_dir = data_dir
         self._experiment_base_dir = experiment_base_dir
@@ -43,6 +55,10 @@ class RunWrapper:
         self._run_num = run_num
         self._experiment_file = experiment_file
         self._experiment_arg_string = experiment_arg_string
+        self._attempt = attempt
+        # the local executor shares one base dir between runs and keeps it.
+        self._remove_base_dir = remove_base_dir
+        self.retcode = None
         self._environ_vars = [f'PYTHONPATH={pythonpath}' ] + self._process_environ_vars(experiment_environ_vars)
 
         run_dir = self._create_run_directory()
@@ -59,10 +75,21 @@ class RunWrapper:
             raise Exception(f'Cannot find experiment directory.')
         run_path = os.path.join(experiment_path, str(self._run_num))
         if os.path.isdir(run_path):
-            raise Exception(f'Run dir {run_path} already exists.')
-        os.mkdir(run_path)
+            if self._attempt == 0:
+                raise Exception(f'Run dir {run_path} already exists.')
+            self._archive_previous_attempt(run_path)
+        else:
+            os.mkdir(run_path)
         return run_path
 
+    def _archive_previous_attempt(self, run_path: str) -> None:
+        # a retry starts from a clean run dir, so data_path stays the same for every attempt.
+        archive_path = os.path.join(run_path, f'attempt_{self._attempt - 1}')
+        os.makedirs(archive_path, exist_ok=True)
+        for name in os.listdir(run_path):
+            if not re.match(r'^attempt_\d+$', name):
+                os.rename(os.path.join(run_path, name), os.path.join(archive_path, name))
+
     def _populate_run_directory(self, run_dir: str) -> None:
         with open(os.path.join(run_dir, 'progress.txt'), 'w') as f:
             f.write(str(0.0))
@@ -75,16 +102,35 @@ class RunWrapper:
         with open(os.path.join(run_dir, 'host.txt'), 'w') as f:
             f.write(sched_utils.get_hostname())
         with open(os.path.join(run_dir, 'pid.txt'), 'w') as f:
-            pass
+            f.write(str(os.getpid()))
         os.mkdir(os.path.join(run_dir, 'stream_data'))
+        status_index.update(os.path.dirname(run_dir), int(self._run_num),
+                            progress=0.0, spun_up=False, hostname=sched_utils.get_hostname())
+
+    def _emit_event(self, name: str, *args: str) -> None:
+        print(events.format_event(name, *args), flush=True)
+
+    def _watch_spun_up(self, run_path: str, p: subprocess.Popen, poll_interval: float = 1.0) -> None:
+        spun_up_file = os.path.join(run_path, 'spun_up.txt')
+        while p.poll() is None:
+            with open(spun_up_file, 'r') as f:
+                if f.read().strip() == '1':
+                    self._emit_event(events.SPUN_UP, str(self._run_num))
+                    return
+            time.sleep(poll_interval)
 
     def _run_experiment(self, run_path: str):
         venv_path = os.path.join(self._experiment_base_dir, self._venv_name)
+        hold_fd = None
+        if os.path.islink(venv_path):
+            # a cached environment may not be evicted while this run uses it.
+            hold_fd = venv_cache.hold(os.path.realpath(venv_path))
         venv_command = f'source {venv_path}/bin/activate'
         python_command = (f'python {os.path.join(self._experiment_base_dir, self._experiment_file)} '
                           f'{self._experiment_arg_string} ')
+        # exported, an assignment in front of source would only reach source itself.
         env_vars = ' '.join(self._environ_vars)
-        full_command = f'{env_vars} {venv_command}; {python_command}'
+        full_command = f'export {env_vars}; {venv_command}; {python_command}'
 
         out_file = os.path.join(run_path, 'stdout.txt')
         err_file = os.path.join(run_path, 'stderr.txt')
@@ -93,22 +139,30 @@ class RunWrapper:
             stdout = open(out_file, 'w')
             stderr = open(err_file, 'w')
             p = subprocess.Popen(full_command, shell=True, stdout=stdout, stderr=stderr, executable='/bin/bash')
-            retcode = p.wait()
+            threading.Thread(target=self._watch_spun_up, args=(run_path, p), daemon=True).start()
+            sampler = footprint.FootprintSampler(p.pid)
+            sampler.start()
+            retcode = self.retcode = p.wait()
+            sampler.stop()
+            sampler.write(run_path)
             # if the program fails write -1 to the progress logger.
-            if retcode != 0:
-                with open(os.path.join(run_path, 'progress.txt'), 'w') as f:
-                    f.write(str(-1))
-            else:
-                with open(os.path.join(run_path, 'progress.txt'), 'w') as f:
-                    f.write(str(1))
+            final_progress = -1 if retcode != 0 else 1
+            with open(os.path.join(run_path, 'progress.txt'), 'w') as f:
+                f.write(str(final_progress))
             with open(os.path.join(run_path, 'spun_up.txt'), 'w') as f:
                 f.write(str(1))
+            status_index.update(os.path.dirname(run_path), int(self._run_num),
+                                progress=final_progress, spun_up=True)
+            self._emit_event(events.FINISHED, str(self._run_num), str(retcode))
         finally:
             if stdout is not None:
                 stdout.close()
             if stderr is not None:
                 stderr.close()
-            shutil.rmtree(self._experiment_base_dir)
+            if hold_fd is not None:
+                os.close(hold_fd)
+            if self._remove_base_dir:
+                shutil.rmtree(self._experiment_base_dir)
 
 
 
@@ -126,6 +180,7 @@ if __name__ == '__main__':
         experiment_file=sys.argv[7],
         experiment_arg_string=sys.argv[8],
         experiment_environ_vars=sys.argv[9],
+        attempt=int(sys.argv[10]) if len(sys.argv) > 10 else 0,
     )
     print(pickle.dumps({}, 0).decode())
 
@@ -1,11 +1,25 @@
+import os
 import pickle
 import sys
 from experiment_suite.scheduler import sweep as sweep_lib
 
+
+def report_and_detach(experiment_data_dir: str) -> None:
+    # the launcher reads until our stdout closes, so report the run file now and finish it in the background.
+    out = {'experiment_data_dir': experiment_data_dir}
+    print(pickle.dumps(out, 0).decode(), flush=True)
+    if os.fork() != 0:
+        os._exit(0)
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    log = os.open(os.path.join(experiment_data_dir, 'run_file_build.log'), os.O_WRONLY | os.O_CREAT, 0o644)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    os.dup2(log, 2)
+
+
 if __name__ == '__main__':
     temp_name = sys.argv[1]
     sweep_file = f'/tmp/sweep_{temp_name}.py'
     machine_file = f'/tmp/machines_{temp_name}'
-    run_file_path = sweep_lib.build_run_file_from_sweep_file(sweep_file, machine_file)
-    out = {'experiment_data_dir': run_file_path}
-    print(pickle.dumps(out, 0).decode())
\ No newline at end of file
+    sweep_lib.build_run_file_from_sweep_file(sweep_file, machine_file, on_first_chunk=report_and_detach)
@@ -1,38 +1,36 @@
-from typing import Optional, List
+from typing import Optional, Dict
 from experiment_suite.scheduler.utils import Run
-import pickle
+from experiment_suite.scheduler import run_queue
 import os
 
+_open_queues: Dict[str, run_queue.RunQueue] = dict()
+
+
+def open_run_queue(run_file: str) -> run_queue.RunQueue:
+    # legacy run_file.pickle files are converted to a run queue next to them on first use.
+    if run_file.endswith('.pickle'):
+        queue_path = os.path.join(os.path.dirname(run_file), 'run_queue')
+        if not run_queue.exists(queue_path) or not run_queue.is_sealed(queue_path):
+            run_queue.convert_pickle_run_file(run_file, queue_path)
+        run_file = queue_path
+    if run_file not in _open_queues:
+        _open_queues[run_file] = run_queue.RunQueue(run_file)
+    return _open_queues[run_file]
+
 
 def peek(run_file: str) -> Optional[Run]:
-    with open(run_file, 'rb') as f:
-        is_scheduled_and_run: List[(bool, Run)] = pickle.load(f)['runs']
-    unscheduled_runs = [run for is_scheduled, run in is_scheduled_and_run
-                        if not is_scheduled]
-    if len(unscheduled_runs) == 0:
-        return None
-    return unscheduled_runs[0]
+    return open_run_queue(run_file).peek()
 
 
 def pop(run_file: str) -> Optional[Run]:
-    with open(run_file, 'rb') as f:
-        run_file_data = pickle.load(f)
-    is_scheduled_and_run: List[(bool, Run)] = run_file_data['runs']
-    unscheduled_runs = [(idx, run) for idx, (is_scheduled, run) in enumerate(is_scheduled_and_run)
-                        if not is_scheduled]
-    if len(unscheduled_runs) == 0:
-        return None
-    idx, run = unscheduled_runs[0]
-    run_file_data['runs'][idx] = (True, run)
-    with open(run_file, 'wb') as f:
-        pickle.dump(run_file_data, f)
-    return run
+    return open_run_queue(run_file).pop()
 
 
 def purge_if_empty(run_file: str) -> None:
-    with open(run_file, 'rb') as f:
-        is_scheduled_and_run = pickle.load(f)['runs']
-    unscheduled_runs = [run for is_scheduled, run in is_scheduled_and_run
-                        if not is_scheduled]
-    if len(unscheduled_runs) == 0:
-        os.remove(run_file)
+    queue = open_run_queue(run_file)
+    if queue.is_finished():
+        queue.close()
+        for path, open_queue in list(_open_queues.items()):
+            if open_queue is queue:
+                del _open_queues[path]
+                run_queue.remove(path)
@@ -0,0 +1,336 @@
+import os
+import pickle
+import struct
+import sys
+import zlib
+from enum import IntEnum
+from typing import Any, Callable, Dict, Iterable, Optional, List
+
+from experiment_suite.scheduler.utils import Run, RunRecord, RunTemplate
+
+'''
+A run queue is made of three files sharing a path prefix:
+-- <path> : header (magic, format version, metadata length), pickled metadata, then
+            length-prefixed pickled run records.
+-- <path>.idx : one fixed-size byte offset into <path> per record, followed by a SEALED
+                marker once every record has been written.
+-- <path>.journal : append-only log of fixed-size (record index, op, checksum) entries
+                    recording which runs have been scheduled, completed, failed for good,
+                    or put back as pending to be retried. A run's attempts are its scheduled entries.
+Records are only referenced by the index after their bytes are flushed, and torn journal
+entries are truncated on open, so a crash halfway through a write loses at most that write.
+'''
+
+_MAGIC = b'RUNQ'
+_VERSION = 1
+_HEADER = struct.Struct('<4sIQ')
+_RECORD_LEN = struct.Struct('<I')
+_INDEX_ENTRY = struct.Struct('<Q')
+_SEALED = 2**64 - 1
+_JOURNAL_ENTRY = struct.Struct('<IBxH')
+
+
+class RunState(IntEnum):
+    PENDING = 0
+    SCHEDULED = 1
+    COMPLETED = 2
+    FAILED = 3
+
+
+def index_path(path: str) -> str:
+    return path + '.idx'
+
+
+def journal_path(path: str) -> str:
+    return path + '.journal'
+
+
+def _checksum(idx: int, op: int) -> int:
+    return zlib.crc32(struct.pack('<IB', idx, op)) & 0xFFFF
+
+
+def _pack_journal_entry(idx: int, op: RunState) -> bytes:
+    return _JOURNAL_ENTRY.pack(idx, int(op), _checksum(idx, int(op)))
+
+
+class RunQueueWriter:
+
+    def __init__(
+            self,
+            path: str,
+            metadata: Dict[str, Any],
+    ):
+        for p in [path, index_path(path), journal_path(path)]:
+            if os.path.exists(p):
+                raise Exception(f'Run queue file {p} already exists.')
+        self._path = path
+        self._data_file = open(path, 'wb')
+        meta_bytes = pickle.dumps(metadata)
+        self._data_file.write(_HEADER.pack(_MAGIC, _VERSION, len(meta_bytes)))
+        self._data_file.write(meta_bytes)
+        self._offset = self._data_file.tell()
+        # the index is only created once the header is complete, readers wait for it.
+        self._data_file.flush()
+        self._index_file = open(index_path(path), 'wb')
+        self._pending_offsets = []
+        self._num_records = 0
+
+    def append(self, record: Any) -> int:
+        record_bytes = pickle.dumps(record)
+        self._data_file.write(_RECORD_LEN.pack(len(record_bytes)))
+        self._data_file.write(record_bytes)
+        self._pending_offsets.append(self._offset)
+        self._offset += _RECORD_LEN.size + len(record_bytes)
+        self._num_records += 1
+        return self._num_records - 1
+
+    def flush(self) -> None:
+        # record bytes must be durable before the index points at them.
+        self._data_file.flush()
+        os.fsync(self._data_file.fileno())
+        self._index_file.write(b''.join(_INDEX_ENTRY.pack(o) for o in self._pending_offsets))
+        self._index_file.flush()
+        os.fsync(self._index_file.fileno())
+        self._pending_offsets = []
+
+    def seal(self) -> None:
+        self.flush()
+        self._index_file.write(_INDEX_ENTRY.pack(_SEALED))
+        self._index_file.flush()
+        os.fsync(self._index_file.fileno())
+        self.close()
+
+    def close(self) -> None:
+        self._data_file.close()
+        self._index_file.close()
+
+    def __enter__(self) -> 'RunQueueWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is None:
+            self.seal()
+        else:
+            self.close()
+
+
+class RunQueue:
+
+    def __init__(self, path: str):
+        self._path = path
+        self._data_fd = os.open(path, os.O_RDONLY)
+        header = os.pread(self._data_fd, _HEADER.size, 0)
+        magic, version, meta_len = _HEADER.unpack(header)
+        if magic != _MAGIC or version != _VERSION:
+            raise Exception(f'{path} is not a version {_VERSION} run queue.')
+        self.metadata: Dict[str, Any] = pickle.loads(os.pread(self._data_fd, meta_len, _HEADER.size))
+        # queues written from a sweep store one template and a compact RunRecord per run.
+        self.template: Optional[RunTemplate] = self.metadata.get('run_template')
+        self._index_fd = os.open(index_path(path), os.O_RDONLY)
+        self._journal_fd = os.open(journal_path(path), os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._num_records = 0
+        self._sealed = False
+        self._states = bytearray()
+        self._head = 0
+        self._num_pending = 0
+        self._attempts: Dict[int, int] = dict()
+        self.refresh()
+        self._replay_journal()
+
+    def _replay_journal(self) -> None:
+        journal_size = os.fstat(self._journal_fd).st_size
+        data = os.pread(self._journal_fd, journal_size, 0)
+        valid_size = 0
+        for entry_start in range(0, len(data) - _JOURNAL_ENTRY.size + 1, _JOURNAL_ENTRY.size):
+            idx, op, checksum = _JOURNAL_ENTRY.unpack_from(data, entry_start)
+            if checksum != _checksum(idx, op) or idx >= self._num_records:
+                break
+            self._set_state(idx, RunState(op))
+            valid_size = entry_start + _JOURNAL_ENTRY.size
+        if valid_size != journal_size:
+            # drop a torn trailing entry so later appends stay aligned.
+            os.ftruncate(self._journal_fd, valid_size)
+
+    def _set_state(self, idx: int, state: RunState) -> None:
+        was_pending = self._states[idx] == RunState.PENDING
+        self._states[idx] = state
+        if state == RunState.SCHEDULED:
+            self._attempts[idx] = self._attempts.get(idx, 0) + 1
+        if was_pending and state != RunState.PENDING:
+            self._num_pending -= 1
+        elif not was_pending and state == RunState.PENDING:
+            self._num_pending += 1
+            self._head = min(self._head, idx)
+
+    def refresh(self) -> None:
+        # picks up records appended by a writer that has not sealed the queue yet.
+        if self._sealed:
+            return
+        index_size = os.fstat(self._index_fd).st_size
+        num_entries = index_size // _INDEX_ENTRY.size
+        if num_entries == 0:
+            return
+        last_entry, = _INDEX_ENTRY.unpack(
+            os.pread(self._index_fd, _INDEX_ENTRY.size, (num_entries - 1) * _INDEX_ENTRY.size))
+        if last_entry == _SEALED:
+            self._sealed = True
+            num_entries -= 1
+        new_records = num_entries - self._num_records
+        if new_records > 0:
+            self._states.extend(bytes(new_records))
+            self._num_pending += new_records
+            self._num_records = num_entries
+
+    def _append_journal(self, idx: int, state: RunState) -> None:
+        os.write(self._journal_fd, _pack_journal_entry(idx, state))
+        os.fsync(self._journal_fd)
+        self._set_state(idx, state)
+
+    def __len__(self) -> int:
+        return self._num_records
+
+    @property
+    def is_sealed(self) -> bool:
+        return self._sealed
+
+    @property
+    def num_pending(self) -> int:
+        return self._num_pending
+
+    def is_finished(self) -> bool:
+        self.refresh()
+        return self._sealed and self._num_pending == 0
+
+    def state(self, idx: int) -> RunState:
+        return RunState(self._states[idx])
+
+    def attempts(self, idx: int) -> int:
+        return self._attempts.get(idx, 0)
+
+    def get_record(self, idx: int) -> Any:
+        if not 0 <= idx < self._num_records:
+            raise IndexError(f'Run index {idx} out of range.')
+        offset, = _INDEX_ENTRY.unpack(os.pread(self._index_fd, _INDEX_ENTRY.size, idx * _INDEX_ENTRY.size))
+        record_len, = _RECORD_LEN.unpack(os.pread(self._data_fd, _RECORD_LEN.size, offset))
+        record = pickle.loads(os.pread(self._data_fd, record_len, offset + _RECORD_LEN.size))
+        return record if self.template is None else RunRecord(*record)
+
+    def get(self, idx: int) -> Run:
+        record = self.get_record(idx)
+        return record if self.template is None else self.template.build(record)
+
+    def peek_index(self) -> Optional[int]:
+        while True:
+            while self._head < self._num_records and self._states[self._head] != RunState.PENDING:
+                self._head += 1
+            if self._head < self._num_records:
+                return self._head
+            if self._sealed:
+                return None
+            num_records = self._num_records
+            self.refresh()
+            if self._num_records == num_records:
+                return None
+
+    def peek(self) -> Optional[Run]:
+        idx = self.peek_index()
+        return None if idx is None else self.get(idx)
+
+    def pending(self, limit: int, where: Optional[Callable[[int], bool]] = None) -> List[int]:
+        # where: pending runs it rejects are skipped without counting towards limit.
+        if self.peek_index() is None:
+            return []
+        indices = []
+        idx = self._head
+        while idx < self._num_records and len(indices) < limit:
+            if self._states[idx] == RunState.PENDING and (where is None or where(idx)):
+                indices.append(idx)
+            idx += 1
+        return indices
+
+    def pop(self) -> Optional[Run]:
+        idx = self.peek_index()
+        if idx is None:
+            return None
+        run = self.get(idx)
+        self.mark_scheduled(idx)
+        return run
+
+    def mark_scheduled(self, idx: int) -> None:
+        self._append_journal(idx, RunState.SCHEDULED)
+
+    def mark_completed(self, idx: int) -> None:
+        self._append_journal(idx, RunState.COMPLETED)
+
+    def mark_failed(self, idx: int) -> None:
+        self._append_journal(idx, RunState.FAILED)
+
+    def requeue(self, idx: int) -> None:
+        self._append_journal(idx, RunState.PENDING)
+
+    def close(self) -> None:
+        os.close(self._data_fd)
+        os.close(self._index_fd)
+        os.close(self._journal_fd)
+
+
+def exists(path: str) -> bool:
+    return os.path.isfile(path) and os.path.isfile(index_path(path))
+
+
+def is_sealed(path: str) -> bool:
+    with open(index_path(path), 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < _INDEX_ENTRY.size:
+            return False
+        f.seek(-_INDEX_ENTRY.size, os.SEEK_END)
+        last_entry, = _INDEX_ENTRY.unpack(f.read(_INDEX_ENTRY.size))
+    return last_entry == _SEALED
+
+
+def remove(path: str) -> None:
+    for p in [path, index_path(path), journal_path(path)]:
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def write_run_queue(
+        path: str,
+        metadata: Dict[str, Any],
+        runs: Iterable[Any],
+        scheduled: Iterable[int] = (),
+) -> str:
+    with RunQueueWriter(path, metadata) as writer:
+        for run in runs:
+            writer.append(run)
+        writer.flush()
+        # the journal is durable before the queue is sealed: a sealed queue is never converted again,
+        # so a crash in between would otherwise dispatch scheduled runs a second time.
+        entries = b''.join(_pack_journal_entry(idx, RunState.SCHEDULED) for idx in scheduled)
+        with open(journal_path(path), 'ab') as f:
+            f.write(entries)
+            f.flush()
+            os.fsync(f.fileno())
+    return path
+
+
+def convert_pickle_run_file(
+        pickle_path: str,
+        queue_path: Optional[str] = None,
+) -> str:
+    if queue_path is None:
+        queue_path = os.path.join(os.path.dirname(pickle_path), 'run_queue')
+    with open(pickle_path, 'rb') as f:
+        run_file_data = pickle.load(f)
+    is_scheduled_and_run = run_file_data.pop('runs')
+    # a conversion interrupted by a crash leaves an unsealed queue behind, start over.
+    remove(queue_path)
+    return write_run_queue(
+        queue_path,
+        run_file_data,
+        runs=(run for _, run in is_scheduled_and_run),
+        scheduled=[idx for idx, (is_scheduled, _) in enumerate(is_scheduled_and_run) if is_scheduled])
+
+
+if __name__ == '__main__':
+    print(convert_pickle_run_file(*sys.argv[1:3]))
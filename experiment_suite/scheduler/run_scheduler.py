@@ -9,46 +9,33 @@ import os
 import sys
 import subprocess
 import argparse
+import concurrent.futures
+import collections
+import threading
 
+from experiment_suite.scheduler import clock as clock_lib
+from experiment_suite.scheduler import metrics
 from experiment_suite.scheduler import run_file_utils
+from experiment_suite.scheduler import placement
+from experiment_suite.scheduler import events
+from experiment_suite.scheduler import scheduler_daemon
+from experiment_suite.scheduler.experiment import Experiment
+from experiment_suite.scheduler.monitor_subscription import MonitorSubscription
+from experiment_suite.scheduler.clients import ClientWrapper, ParamikoClient, LocalClient, connect_parallel
 
 
-class ClientWrapper:
+# seconds per remote command and host, from sending it to reading its whole output.
+HOST_RTT = 'scheduler_host_rtt_seconds'
+# seconds per part of a scheduling cycle.
+PHASE_TIME = 'scheduler_phase_seconds'
+# where the schedule and daemon modes export metrics to, if set.
+METRICS_FILE_ENV = 'EXPERIMENT_SUITE_METRICS_FILE'
 
-    def exec_command(self, command: str) -> Tuple[IO, IO, IO]:
-        raise NotImplementedError
 
-
-class ParamikoClient(ClientWrapper):
-
-    def __init__(
-            self,
-            user: str,
-            machine_address: str,
-            timeout: int = 10
-    ):
-        client = paramiko.SSHClient()
-        client.load_system_host_keys()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(hostname=machine_address,
-                       username=user,
-                       timeout=timeout)
-        self._client = client
-
-    def exec_command(self, command: str) -> Tuple[IO, IO, IO]:
-        return self._client.exec_command(command)
-
-
-class LocalClient(ClientWrapper):
-
-    def exec_command(self, command: str) -> Tuple[IO, IO, IO]:
-        p = subprocess.Popen(command,
-                             shell=True,
-                             stdin=subprocess.PIPE,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE,
-                             executable='/bin/bash')
-        return p.stdin, p.stdout, p.stderr
+def build_remote_command(remote_exec: str, args: List[str]) -> str:
+    # Assumes scheduler has its own venv that it can safely launch executables from.
+    return ('source ~/scheduler/venv/bin/activate; '
+            f'python -m experiment_suite.scheduler.remote_executables.{remote_exec} ' + ' '.join(args))
 
 
 def execute_across_machines(
@@ -57,15 +44,15 @@ def execute_across_machines(
         machines: Iterable[Tuple[str, ClientWrapper]],
         wait_for_finish: bool = True
 ) -> Union[Dict[str, Any], None]:
-    # Assumes scheduler has its own venv that it can safely launch executables from.
-    command = ('source ~/scheduler/venv/bin/activate; ' 
-               f'python -m experiment_suite.scheduler.remote_executables.{remote_exec} ' + ' '.join(args))
+    command = build_remote_command(remote_exec, args)
     all_run_data = dict()
     for addr, client in machines:
-        _, stdout, _ = client.exec_command(command)
         if not wait_for_finish:
+            client.exec_command(command)
             continue
-        out = stdout.read()
+        with metrics.REGISTRY.time(HOST_RTT, host=addr, command=remote_exec):
+            _, stdout, _ = client.exec_command(command)
+            out = stdout.read()
         client_data: Dict[str, Any] = pickle.loads(out)
         all_run_data[addr] = client_data
     if not wait_for_finish:
@@ -73,47 +60,274 @@ def execute_across_machines(
     return all_run_data
 
 
+def _execute_on_machine(
+        client: ClientWrapper,
+        command: str,
+        timeout: float,
+        addr: str,
+        remote_exec: str,
+) -> Dict[str, Any]:
+    with metrics.REGISTRY.time(HOST_RTT, host=addr, command=remote_exec):
+        _, stdout, _ = client.exec_command(command)
+        if hasattr(stdout, 'channel'):
+            # keeps a stalled paramiko read from outliving the caller's deadline.
+            stdout.channel.settimeout(timeout)
+        out = stdout.read()
+    return pickle.loads(out)
+
+
+def execute_across_machines_parallel(
+        remote_exec: str,
+        args: List[str],
+        machines: Iterable[Tuple[str, ClientWrapper]],
+        timeout: float = 30,
+        executor: Optional[concurrent.futures.ThreadPoolExecutor] = None,
+        in_flight: Optional[Dict[str, concurrent.futures.Future]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Exception]]:
+    # a long-lived caller passes its own bounded executor, and in_flight to keep track of the calls
+    # that missed their deadline: their hosts are skipped until those calls return.
+    command = build_remote_command(remote_exec, args)
+    machines = list(machines)
+    all_run_data, errors = dict(), dict()
+    if in_flight is not None:
+        for addr, future in list(in_flight.items()):
+            if future.done():
+                del in_flight[addr]
+        busy = [addr for addr, _ in machines if addr in in_flight]
+        errors.update((addr, TimeoutError('An earlier call has not returned yet.')) for addr in busy)
+        machines = [(addr, client) for addr, client in machines if addr not in in_flight]
+    if not machines:
+        return all_run_data, errors
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(machines))
+    future_to_addr = {executor.submit(_execute_on_machine, client, command, timeout, addr, remote_exec): addr
+                      for addr, client in machines}
+    done, not_done = concurrent.futures.wait(future_to_addr, timeout=timeout)
+    if own_executor:
+        # do not wait on hosts that missed the deadline, their threads finish in the background.
+        executor.shutdown(wait=False)
+    for future in done:
+        addr = future_to_addr[future]
+        if (err := future.exception()) is not None:
+            errors[addr] = err
+        else:
+            all_run_data[addr] = future.result()
+    for future in not_done:
+        if not future.cancel() and in_flight is not None:
+            in_flight[future_to_addr[future]] = future
+        errors[future_to_addr[future]] = TimeoutError(f'No response within {timeout}s.')
+    return all_run_data, errors
+
+
 class RunScheduler:
 
     def __init__(
             self,
-            run_file: str,
+            run_file: Optional[str] = None,
+            host_timeout: float = 10,
+            use_monitor_agent: bool = True,
+            monitor_max_age: float = 5,
+            backfill_window: int = 64,
+            learn_footprints: bool = True,
+            max_attempts: int = 3,
+            vanish_timeout: float = 10 * 60,
+            clock: clock_lib.Clock = clock_lib.SYSTEM_CLOCK,
+            metrics_file: Optional[str] = None,
+            metrics_interval: float = 15,
+            max_host_threads: int = 64,
     ):
-        with open(run_file, 'rb') as f:
-            run_file_data = pickle.load(f)
-        self._run_file = run_file
-        self._xid = run_file_data['xid']
-        self._user_plus_machines = run_file_data['user_plus_machines']
-        self._github_ssh_link = run_file_data['github_ssh_link']
-        self._data_dir = run_file_data['data_dir']
-        self._venv_name = run_file_data['venv_name']
-        self._experiments_dir = run_file_data['experiments_dir']
-        self._blocking_machines = set()
-        self._machine_clients = {upm.split('@')[1]: self._connect_to_machine(upm)
-                                 for upm in self._user_plus_machines}
+        # one scheduler can serve many run files: machines are polled once for all of them and
+        # free resources are offered by priority, then by weighted fair share. see submit.
+        self._host_timeout = host_timeout
+        self._monitor_max_age = monitor_max_age
+        self._use_monitor_agent = use_monitor_agent
+        self._learn_footprints = learn_footprints
+        self._max_attempts = max_attempts
+        # how long a run whose host cannot be reached may go unaccounted for before it is retried.
+        self._vanish_timeout = vanish_timeout
+        self._clock = clock
+        # phase timings, queue depths and host round trips go to metrics_file every metrics_interval
+        # seconds, as JSON lines if it ends in .jsonl and as a Prometheus text file otherwise.
+        self._metrics_file = metrics_file
+        self._metrics_interval = metrics_interval
+        self._metrics_exported_at: Optional[float] = None
+        # (xid, run_num, return code) of launched runs whose run_wrapper channel closed, None if it
+        # closed without reporting a result.
+        self._run_outcomes: List[Tuple[int, int, Optional[int]]] = []
+        self._outcome_lock = threading.Lock()
+        self._events = events.SchedulerEvents()
+        self._ledger = placement.ResourceLedger()
+        self._placement_engine = placement.PlacementEngine(self._ledger, backfill_window=backfill_window)
+        self._experiments: Dict[int, Experiment] = dict()
+        # experiments submitted from other threads wait here until the scheduling loop picks them up.
+        self._submitted: List[Experiment] = []
+        self._submit_lock = threading.Lock()
+        self._machine_clients: Dict[str, ClientWrapper] = dict()
+        # polls of every host share one pool of max_host_threads, a host whose last call is still
+        # stuck is not called again until it returns.
+        self._host_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_host_threads)
+        self._host_calls: Dict[str, concurrent.futures.Future] = dict()
+        self._monitor_subscriptions: Dict[str, MonitorSubscription] = dict()
+        if run_file is not None:
+            self.submit(run_file)
+            self._accept_submissions()
 
     def _connect_to_machine(self, user_plus_machine: str) -> ClientWrapper:
         user, machine_address = user_plus_machine.split('@')
         if self._is_own_address(machine_address):
             client = LocalClient()
         else:
-            client = ParamikoClient(user, machine_address)
+            client = ParamikoClient(user, machine_address, timeout=self._host_timeout, lazy=True)
         return client
 
-    def _get_blocking_machines(self) -> Set[str]:
-        run_data = execute_across_machines('get_xid_info',
-                                           args=[self._data_dir, str(self._xid)],
-                                           machines=self._machine_clients.items())
+    def _add_machines(self, user_plus_machines: List[str]) -> None:
+        new_clients = {upm.split('@')[1]: self._connect_to_machine(upm) for upm in user_plus_machines
+                       if upm.split('@')[1] not in self._machine_clients}
+        # hosts that fail to connect stay in the pool and reconnect when next used.
+        self._report_errors('connect', connect_parallel(new_clients, timeout=self._host_timeout))
+        self._machine_clients.update(new_clients)
+        if self._use_monitor_agent:
+            subscribe_command = build_remote_command('monitor_agent', ['subscribe'])
+            for addr, client in new_clients.items():
+                subscription = MonitorSubscription(client, subscribe_command)
+                subscription.add_listener(self._make_resource_jump_listener())
+                self._monitor_subscriptions[addr] = subscription
+
+    def submit(self, run_file: str, priority: int = 0, weight: float = 1.0) -> int:
+        # safe to call from any thread, returns the xid of the submitted experiment.
+        experiment = Experiment(run_file, priority=priority, weight=weight,
+                                learn_footprints=self._learn_footprints, max_attempts=self._max_attempts,
+                                clock=self._clock, ledger=self._ledger)
+        with self._submit_lock:
+            if experiment.xid in self._experiments or any(e.xid == experiment.xid for e in self._submitted):
+                raise Exception(f'Experiment {experiment.xid} is already being scheduled.')
+            self._submitted.append(experiment)
+        self._events.notify(events.SUBMITTED)
+        return experiment.xid
+
+    def _accept_submissions(self) -> None:
+        with self._submit_lock:
+            submitted, self._submitted = self._submitted, []
+        for experiment in submitted:
+            self._add_machines(experiment.user_plus_machines)
+            with self._submit_lock:
+                self._experiments[experiment.xid] = experiment
+            print(f'Scheduling experiment {experiment.xid} (priority {experiment.priority}, '
+                  f'weight {experiment.weight}).')
+
+    def summary(self) -> List[Dict[str, Any]]:
+        with self._submit_lock:
+            experiments = list(self._experiments.values()) + list(self._submitted)
+        return [experiment.summary() for experiment in experiments]
+
+    def _refresh_run_status(self, experiments: List[Experiment]) -> None:
+        for experiment in experiments:
+            if experiment.has_local_index():
+                experiment.refresh_from_index()
+                continue
+            machines = [(addr, self._machine_clients[addr]) for addr in experiment.machines]
+            run_data, errors = execute_across_machines_parallel('get_xid_info',
+                                                                args=[experiment.data_dir, str(experiment.xid)],
+                                                                machines=machines,
+                                                                timeout=self._host_timeout,
+                                                                executor=self._host_executor,
+                                                                in_flight=self._host_calls)
+            self._report_errors('get_xid_info', errors)
+            for _, machine_runs_data in run_data.items():
+                experiment.update_status({int(run_num): info for run_num, info in machine_runs_data.items()})
+
+    def _get_blocking_machines(self, experiments: List[Experiment]) -> Set[str]:
+        self._refresh_run_status(experiments)
         blocking_machines = set()
-        for _, machine_runs_data in run_data.items():
-            for run_num, run_data in machine_runs_data.items():
-                if not run_data['spun_up']:
-                    hostname = run_data['hostname']
-                    machine_addr = f'{hostname}.eecs.umich.edu'
-                    blocking_machines.add(machine_addr)
-                    break
+        for experiment in experiments:
+            for hostname in experiment.blocking_hosts():
+                blocking_machines.add(f'{hostname}.eecs.umich.edu')
         return blocking_machines
 
+    def _make_resource_jump_listener(
+            self,
+            min_freed_ram: float = 2 * 1024**3,
+            min_freed_cpu: float = 20,
+    ) -> Callable[[Tuple[float, Dict[str, float]]], None]:
+        previous = dict()
+
+        def listener(sample: Tuple[float, Dict[str, float]]) -> None:
+            _, data = sample
+            if previous:
+                freed = {key: data[key] - previous[key] for key in data if key in previous}
+                freed_gpu_ram = max([v for k, v in freed.items() if k.endswith('-mem-free')], default=0)
+                if (freed.get('free_mem', 0) >= min_freed_ram or freed.get('idle_cpu', 0) >= min_freed_cpu
+                        or freed_gpu_ram >= min_freed_ram):
+                    self._events.notify(events.RESOURCES_FREED)
+            previous.clear()
+            previous.update(data)
+        return listener
+
+    def _watch_run(self, stdout: IO, xid: int, run_num: int) -> None:
+        # run_wrapper keeps its channel open for the life of the run and reports events on it.
+        retcode = None
+        try:
+            while line := stdout.readline():
+                if (event := events.parse_event(line)) is not None:
+                    name, args = event
+                    if name == events.FINISHED:
+                        retcode = int(args[1])
+                    self._events.notify(name)
+        except Exception as e:
+            print(f'Lost channel to run {run_num} of {xid}: {e!r}')
+        finally:
+            with self._outcome_lock:
+                self._run_outcomes.append((xid, run_num, retcode))
+            self._events.notify(events.RUN_EXITED)
+
+    def _handle_run_outcomes(self) -> None:
+        with self._outcome_lock:
+            outcomes, self._run_outcomes = self._run_outcomes, []
+        for xid, run_num, retcode in outcomes:
+            if (experiment := self._experiments.get(xid)) is None:
+                continue
+            result = 'lost' if retcode is None else 'completed' if retcode == 0 else 'failed'
+            metrics.REGISTRY.inc('scheduler_run_exits_total', result=result)
+            if retcode == 0:
+                experiment.finish_run(run_num)
+            elif retcode is not None:
+                experiment.fail_run(run_num, f'exited with {retcode}')
+            elif run_num in experiment.launched:
+                experiment.suspects[run_num] = self._clock.time()
+
+    def _is_run_alive(self, experiment: Experiment, run_num: int) -> bool:
+        launched = experiment.launched[run_num]
+        pid_file = os.path.join(experiment.run_dir(run_num), 'pid.txt')
+        _, stdout, _ = self._machine_clients[launched.addr].exec_command(
+            f'kill -0 $(cat {pid_file}) 2>/dev/null && echo alive')
+        if hasattr(stdout, 'channel'):
+            stdout.channel.settimeout(self._host_timeout)
+        out = stdout.read()
+        return (out.decode() if isinstance(out, bytes) else out).strip() == 'alive'
+
+    def _check_suspects(self, experiments: List[Experiment]) -> None:
+        # a closed channel is either a dead run (host reboot, killed wrapper) or a network blip.
+        now = self._clock.time()
+        for experiment in experiments:
+            for run_num, since in list(experiment.suspects.items()):
+                try:
+                    alive = self._is_run_alive(experiment, run_num)
+                except Exception as e:
+                    if now - since > self._vanish_timeout:
+                        experiment.fail_run(run_num, f'vanished ({e!r})')
+                    continue
+                if alive:
+                    del experiment.suspects[run_num]
+                    experiment.orphans.add(run_num)
+                else:
+                    experiment.fail_run(run_num, 'vanished')
+
+    def _report_errors(self, remote_exec: str, errors: Dict[str, Exception]) -> None:
+        for addr, err in errors.items():
+            metrics.REGISTRY.inc('scheduler_host_errors_total', host=addr, command=remote_exec)
+            print(f'({addr}) {remote_exec} failed: {err!r}')
+
     # TODO figure out a way to make this non-michigan specific
     def _is_own_address(self, address: str) -> bool:
         match = re.match(r'^(.+?)\.eecs\.umich\.edu$', address)
@@ -126,48 +340,87 @@ class RunScheduler:
             own_machine_name = f.read().strip()
         return own_machine_name == machine_name
 
-    def _place_on_gpu(self, addr: str, monitor_data: Dict[str, Any], required_gpu_ram: int) -> int:
-        resources = monitor_data[addr]
-        for key in resources:
-            if m := re.match(r'^gpu(\d+)-free-mem', key):
-                gpu_num = int(m.groups()[0])
-                if resources[key] > required_gpu_ram:
-                    return gpu_num
-        return -1
-
-    def _find_ready_machine(self, run: Run) -> Optional[Tuple[str, Optional[int]]]:
-        monitor_data = execute_across_machines('get_monitor_data',
-                                               args=[],
-                                               machines=self._machine_clients.items())
-        blocking_machines = self._get_blocking_machines()
-
-        # find a machine that can fit the run
-        for addr, resources in monitor_data.items():
-            if addr in blocking_machines:
-                continue
-            has_cpu = resources['idle_cpu'] > 10
-            has_ram = resources['free_mem'] > run.required_ram
-            # assess if resources are ready.
-            if run.required_gpu_ram is not None:
-                gpu_num = self._place_on_gpu(addr, monitor_data, run.required_gpu_ram)
-                resources_ready = has_cpu and has_ram and (gpu_num != -1)
-            else:
-                resources_ready = has_cpu and has_ram
-                gpu_num = None
-            if resources_ready:
-                return addr, gpu_num
-        return None
+    def _get_monitor_data(self) -> Dict[str, Dict[str, float]]:
+        monitor_data = dict()
+        for addr, subscription in self._monitor_subscriptions.items():
+            if (data := subscription.latest(max_age=self._monitor_max_age)) is not None:
+                monitor_data[addr] = data
+            elif not subscription.is_alive:
+                subscription.start()
+        # hosts without a fresh subscribed sample are polled directly.
+        unsampled_machines = [(addr, client) for addr, client in self._machine_clients.items()
+                              if addr not in monitor_data]
+        polled_data, errors = execute_across_machines_parallel('get_monitor_data',
+                                                               args=[],
+                                                               machines=unsampled_machines,
+                                                               timeout=self._host_timeout,
+                                                               executor=self._host_executor,
+                                                               in_flight=self._host_calls)
+        self._report_errors('get_monitor_data', errors)
+        monitor_data.update(polled_data)
+        return monitor_data
+
+    def _order_candidates(
+            self,
+            experiments: List[Experiment],
+            max_runs: int,
+    ) -> List[Tuple[placement.CandidateKey, Run]]:
+        # higher priority first. within a priority, the next run comes from the experiment furthest
+        # below its weighted share, counting the runs it already has going and those picked so far.
+        now = self._clock.time()
+        # failed runs waiting out their retry backoff are skipped, ready runs behind them take their place.
+        pending = {e.xid: collections.deque(e.run_queue.pending(max_runs, where=lambda idx, e=e: e.is_ready(idx, now)))
+                   for e in experiments}
+        shares = {e.xid: len(e.active) for e in experiments}
+        by_xid = {e.xid: e for e in experiments}
+        candidates = []
+        while len(candidates) < max_runs:
+            ready = [xid for xid, indices in pending.items() if indices]
+            if not ready:
+                break
+            if len(ready) == 1:
+                # no one left to share with, the rest come in queue order.
+                xid = ready[0]
+                indices = itertools.islice(pending[xid], max_runs - len(candidates))
+                candidates.extend(((xid, idx), by_xid[xid].candidate(idx)) for idx in indices)
+                break
+            xid = min(ready, key=lambda x: (-by_xid[x].priority, shares[x] / by_xid[x].weight))
+            idx = pending[xid].popleft()
+            shares[xid] += 1
+            candidates.append(((xid, idx), by_xid[xid].candidate(idx)))
+        return candidates
+
+    def _place_runs(
+            self,
+            experiments: List[Experiment],
+            candidates: List[Tuple[placement.CandidateKey, Run]],
+    ) -> List[placement.Placement]:
+        with self._phase('monitor_poll'):
+            monitor_data = self._get_monitor_data()
+        with self._phase('blocking_machines'):
+            blocking_machines = self._get_blocking_machines(experiments)
+        with self._phase('placement'):
+            self._ledger.expire(self._clock.time())
+            machines_by_xid = {e.xid: e.machines for e in experiments}
+            avoid_machines = {(e.xid, idx): hosts for e in experiments for idx, hosts in e.avoid_hosts.items()}
+            placements = self._placement_engine.place(candidates, monitor_data, blocking_machines,
+                                                      machines_by_xid, avoid_machines)
+        for reason, count in self._placement_engine.last_failures.items():
+            metrics.REGISTRY.inc('scheduler_placement_failures_total', count, reason=reason)
+        return placements
 
     def _launch_run(
             self,
             addr: str,
-            experiments_dir: str,
+            experiment: Experiment,
             run: Run,
-            gpu: Optional[int]
+            gpu: Optional[int],
+            attempt: int = 0,
     ) -> None:
         data = execute_across_machines(
             'create_experiment',
-            args=[experiments_dir, str(run.xid), str(run.run_num), self._github_ssh_link],
+            args=[experiment.experiments_dir, str(run.xid), str(run.run_num), experiment.github_ssh_link, str(attempt)]
+                 + ([] if experiment.git_commit is None else [experiment.git_commit]),
             machines=[(addr, self._machine_clients[addr])]
         )
         experiment_base_dir: str = data[addr]['experiment_dir']
@@ -179,7 +432,8 @@ class RunScheduler:
             x = x.replace('"', '\\"')
             return f'"{x}"'
 
-        environ_vars = run.experiment_environ_vars + f' {cuda_env_var}' + f' {jax_safe_mem_var}'
+        # run_wrapper splits these on commas, the placed gpu is the only device the run can see.
+        environ_vars = ','.join(v for v in [run.experiment_environ_vars, cuda_env_var, jax_safe_mem_var] if v)
         exec_args = [
             run.data_dir,
             experiment_base_dir,
@@ -190,46 +444,160 @@ class RunScheduler:
             run.experiment_file,
             package_arg(run.experiment_arg_string),
             package_arg(environ_vars),
+            str(attempt),
         ]
-        execute_across_machines(
-            'run_wrapper',
-            args=exec_args,
-            machines=[(addr, self._machine_clients[addr])],
-            wait_for_finish=False
-        )
+        with metrics.REGISTRY.time(HOST_RTT, host=addr, command='run_wrapper'):
+            _, stdout, _ = self._machine_clients[addr].exec_command(build_remote_command('run_wrapper', exec_args))
+        threading.Thread(target=self._watch_run, args=(stdout, run.xid, run.run_num), daemon=True).start()
+
+    def _wait_for_event(self, wait_time: float, min_cycle_interval: float) -> None:
+        # wake on run or resource events, the timer is only a fallback.
+        if self._clock.wait(self._events, wait_time):
+            # let a burst of events settle into a single scheduling cycle.
+            self._clock.sleep(min_cycle_interval)
+            self._clock.wait(self._events, 0)
+
+    def _active_experiments(self) -> List[Experiment]:
+        for xid, experiment in list(self._experiments.items()):
+            if experiment.is_finished():
+                print(f'Every run of experiment {xid} has finished.')
+                with self._submit_lock:
+                    del self._experiments[xid]
+                metrics.REGISTRY.set('scheduler_queue_pending', 0, xid=xid)
+                metrics.REGISTRY.set('scheduler_runs_active', 0, xid=xid)
+        return list(self._experiments.values())
+
+    def _phase(self, name: str):
+        return metrics.REGISTRY.time(PHASE_TIME, phase=name)
+
+    def _record_queue_depths(self, experiments: List[Experiment]) -> None:
+        for experiment in experiments:
+            metrics.REGISTRY.set('scheduler_queue_pending', experiment.run_queue.num_pending, xid=experiment.xid)
+            metrics.REGISTRY.set('scheduler_runs_active', len(experiment.active), xid=experiment.xid)
+        metrics.REGISTRY.set('scheduler_reservations', len(self._ledger))
+
+    def _end_cycle(self, outcome: str, cycle_start: float) -> None:
+        metrics.REGISTRY.observe(PHASE_TIME, time.perf_counter() - cycle_start, phase='cycle')
+        metrics.REGISTRY.inc('scheduler_cycles_total', outcome=outcome)
+        self._export_metrics()
+
+    def _export_metrics(self, force: bool = False) -> None:
+        if self._metrics_file is None:
+            return
+        now = self._clock.time()
+        exported_at = self._metrics_exported_at
+        if not force and exported_at is not None and now - exported_at < self._metrics_interval:
+            return
+        self._metrics_exported_at = now
+        try:
+            metrics.REGISTRY.export(self._metrics_file, now)
+        except OSError as e:
+            # scheduling goes on without metrics.
+            print(f'Failed to export metrics to {self._metrics_file}: {e!r}')
 
     def run(
             self,
-            wait_time: float = 5):
-        run = run_file_utils.peek(self._run_file)
-        while run is not None:
-            ready_opt = self._find_ready_machine(run)
-            if ready_opt is None:
+            wait_time: float = 5,
+            max_runs_per_cycle: int = 256,
+            min_cycle_interval: float = 0.1,
+            exit_when_finished: bool = True):
+        # a daemon (exit_when_finished=False) keeps waiting for new submissions once its experiments finish.
+        while True:
+            cycle_start = time.perf_counter()
+            with self._phase('accept_submissions'):
+                self._accept_submissions()
+            with self._phase('handle_run_outcomes'):
+                self._handle_run_outcomes()
+            with self._phase('check_suspects'):
+                self._check_suspects(list(self._experiments.values()))
+            experiments = self._active_experiments()
+            if not experiments and exit_when_finished:
+                self._export_metrics(force=True)
+                break
+            with self._phase('order_candidates'):
+                candidates = self._order_candidates(experiments, max_runs_per_cycle)
+            self._record_queue_depths(experiments)
+            if not candidates:
+                # the run files are still being written, or there is nothing to schedule.
+                self._end_cycle('no_candidates', cycle_start)
+                self._wait_for_event(wait_time, min_cycle_interval)
+                continue
+            placements = self._place_runs(experiments, candidates)
+            if not placements:
                 print('No ready machines... waiting.')
-                time.sleep(wait_time)
+                self._end_cycle('nothing_placed', cycle_start)
+                self._wait_for_event(wait_time, min_cycle_interval)
+                continue
+            now = self._clock.time()
+            for p in placements:
+                self._ledger.reserve(p.run, p.addr, p.gpu, now)
+            # create_experiment can take minutes per run, so placements are launched side by side.
+            with self._phase('launch'), concurrent.futures.ThreadPoolExecutor(max_workers=len(placements)) as executor:
+                future_to_placement = {
+                    executor.submit(self._launch_run, p.addr, self._experiments[p.run.xid], p.run, p.gpu,
+                                    self._experiments[p.run.xid].run_queue.attempts(p.run_idx[1])): p
+                    for p in placements}
+            now = self._clock.time()
+            with self._phase('queue_journal'):
+                for future, p in future_to_placement.items():
+                    xid, idx = p.run_idx
+                    if (err := future.exception()) is not None:
+                        self._ledger.release(p.run.xid, p.run.run_num)
+                        metrics.REGISTRY.inc('scheduler_launches_total', outcome='error')
+                        print(f'({p.addr}) Failed to launch run {p.run.run_num} of {xid}: {err!r}')
+                    else:
+                        experiment = self._experiments[xid]
+                        # from when the run could have gone out to when it is running on its host.
+                        metrics.REGISTRY.observe('scheduler_dispatch_latency_seconds',
+                                                 now - experiment.ready_since(idx), buckets=metrics.DISPATCH_BUCKETS)
+                        metrics.REGISTRY.inc('scheduler_launches_total', outcome='ok')
+                        experiment.record_launch(idx, p.run.run_num, p.addr)
+                        print(f'Launched run {p.run.run_num} of {xid} on {p.addr}.')
+            self._end_cycle('launched', cycle_start)
+            if len(placements) >= max_runs_per_cycle:
+                # the cap cut placement short and more runs may fit, so no event is waited for.
+                self._clock.sleep(min_cycle_interval)
             else:
-                (addr, gpu) = ready_opt
-                self._launch_run(addr, self._experiments_dir, run, gpu)
-                run_file_utils.pop(self._run_file)
-                print(f'Launched on {addr}.')
-                time.sleep(wait_time)
-                run = run_file_utils.peek(self._run_file)
+                self._wait_for_event(wait_time, min_cycle_interval)
 
 
 def run_as_script():
     mode = sys.argv[1]
-    if mode not in ['update', 'schedule']:
-        raise Exception(f'Mode {mode} not expected. Must be either "update" or "schedule".')
+    if mode not in ['update', 'schedule', 'daemon', 'submit', 'list']:
+        raise Exception(f'Mode {mode} not expected. Must be one of "update", "schedule", '
+                        f'"daemon", "submit" or "list".')
     if mode == 'update':
         execute_across_machines('update_scheduler',
                                 args=[],
                                 machines=[('local', LocalClient())],
                                 wait_for_finish=True
                                 )
-    else:
+    elif mode == 'schedule':
         run_file = sys.argv[2]
-        sched = RunScheduler(run_file)
+        sched = RunScheduler(run_file, metrics_file=os.environ.get(METRICS_FILE_ENV))
         sched.run()
+    elif mode == 'daemon':
+        # daemon [run_file ...]: serve submissions and schedule until killed.
+        sched = RunScheduler(metrics_file=os.environ.get(METRICS_FILE_ENV))
+        try:
+            scheduler_daemon.serve_in_background(sched)
+        except OSError:
+            # lost the race to another daemon on this host, hand it our run files instead.
+            for run_file in sys.argv[2:]:
+                print(f'Submitted experiment {scheduler_daemon.submit(run_file)} to the running daemon.')
+            return
+        for run_file in sys.argv[2:]:
+            sched.submit(os.path.abspath(run_file))
+        sched.run(exit_when_finished=False)
+    elif mode == 'submit':
+        # submit run_file [priority] [weight]
+        run_file = sys.argv[2]
+        priority = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+        weight = float(sys.argv[4]) if len(sys.argv) > 4 else 1.0
+        print(f'Submitted experiment {scheduler_daemon.submit(run_file, priority, weight)}.')
+    else:
+        for summary in scheduler_daemon.list_experiments():
+            print(summary)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,63 @@
+import os
+import socketserver
+import threading
+from typing import Any, Dict, List
+
+from experiment_suite.scheduler.monitors import agent as agent_lib
+
+
+def socket_address() -> str:
+    # abstract namespace socket: one scheduler daemon per user per host.
+    return f'\0experiment_suite_scheduler_daemon_{os.getuid()}'
+
+
+class _DaemonRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self) -> None:
+        scheduler = self.server.scheduler
+        request = self.rfile.readline().decode().split()
+        if not request:
+            # liveness probes connect and hang up without a command.
+            return
+        command, *args = request
+        try:
+            if command == 'submit':
+                run_file, *options = args
+                priority = int(options[0]) if len(options) > 0 else 0
+                weight = float(options[1]) if len(options) > 1 else 1.0
+                response = scheduler.submit(run_file, priority=priority, weight=weight)
+            elif command == 'list':
+                response = scheduler.summary()
+            else:
+                raise Exception(f'Unknown scheduler daemon command "{command}".')
+        except Exception as e:
+            # errors are sent back so the submitter sees them, the daemon keeps running.
+            response = e
+        self.wfile.write(agent_lib.encode_line(response))
+
+
+class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_in_background(scheduler, address: str = None) -> socketserver.BaseServer:
+    # raises OSError if another daemon already holds the address.
+    server = _DaemonServer(socket_address() if address is None else address, _DaemonRequestHandler)
+    server.scheduler = scheduler
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _request(command: str, address: str = None, timeout: float = 30) -> Any:
+    response = agent_lib.request(command, socket_address() if address is None else address, timeout)
+    if isinstance(response, Exception):
+        raise response
+    return response
+
+
+def submit(run_file: str, priority: int = 0, weight: float = 1.0, address: str = None) -> int:
+    return _request(f'submit {os.path.abspath(run_file)} {priority} {weight}', address)
+
+
+def list_experiments(address: str = None) -> List[Dict[str, Any]]:
+    return _request('list', address)
@@ -0,0 +1,162 @@
+import argparse
+import contextlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from experiment_suite.scheduler import metrics
+from experiment_suite.scheduler import run_file_utils
+from experiment_suite.scheduler.simulation import workload
+from experiment_suite.scheduler.simulation.cluster import GiB, MachineSpec, SimulatedCluster, make_machines
+from experiment_suite.scheduler.simulation.scheduler import SimulatedScheduler
+
+'''
+Scheduler benchmarks on simulated clusters. Per scenario:
+-- makespan_s : virtual seconds until the last run exited.
+-- queue_wait_p50_s, queue_wait_p95_s : virtual seconds from submission to a run's first launch.
+-- dispatch_latency_p50_s, dispatch_latency_p95_s : virtual seconds from a run exiting to the
+   scheduler launching another run on that machine.
+-- cpu_utilization, ram_utilization, gpu_ram_utilization : share of the cluster busy over the makespan.
+-- cpu_oversubscription : core seconds runs wanted beyond their machines' cores, as a share of the
+   cluster's over the makespan. runs on oversubscribed machines slow down, so anything above 0 is
+   placement overbooking cores.
+-- cycles, cycle_p50_ms, cycle_p95_ms : scheduling cycles and the wall time each spent polling and placing.
+-- scheduler_cpu_s, wall_s : cpu and wall time of the whole simulation, the simulated machines'
+   bookkeeping included.
+'''
+
+
+@dataclass
+class Scenario:
+    name: str
+    num_hosts: int
+    num_runs: int
+    machine: MachineSpec = field(default_factory=MachineSpec)
+    # overrides of WorkloadSpec defaults.
+    workload: Dict[str, Any] = field(default_factory=dict)
+    num_experiments: int = 1
+    shared_data_dir: bool = True
+
+
+SCENARIOS = [
+    Scenario('1x100', num_hosts=1, num_runs=100),
+    Scenario('10x1k', num_hosts=10, num_runs=1_000),
+    Scenario('10x1k-flaky', num_hosts=10, num_runs=1_000, workload={'failure_rate': 0.1}),
+    Scenario('10x1k-polled', num_hosts=10, num_runs=1_000, shared_data_dir=False),
+    Scenario('100x10k', num_hosts=100, num_runs=10_000),
+    Scenario('100x10k-gpu', num_hosts=100, num_runs=10_000, machine=MachineSpec(gpus=4),
+             workload={'required_gpu_ram': 8 * GiB}),
+    Scenario('100x10k-3xid', num_hosts=100, num_runs=10_000, num_experiments=3),
+    Scenario('1000x100k', num_hosts=1000, num_runs=100_000),
+]
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    return float(np.percentile(values, q)) if values else None
+
+
+def run_scenario(
+        scenario: Scenario,
+        work_dir: str,
+        max_runs_per_cycle: int = 256,
+        **scheduler_kwargs,
+) -> Dict[str, Any]:
+    # scheduler metrics, if exported, cover one scenario at a time.
+    metrics.REGISTRY.reset()
+    machines = make_machines(scenario.num_hosts, scenario.machine)
+    cluster = SimulatedCluster(machines, shared_data_dir=scenario.shared_data_dir)
+    scheduler = SimulatedScheduler(cluster, **scheduler_kwargs)
+    user_plus_machines = [f'sim@{addr}' for addr in machines]
+    data_dir = os.path.join(work_dir, 'data')
+    run_files = []
+    for i in range(scenario.num_experiments):
+        # the first experiment takes the remainder.
+        num_runs = scenario.num_runs // scenario.num_experiments
+        num_runs += scenario.num_runs % scenario.num_experiments if i == 0 else 0
+        spec = workload.WorkloadSpec(num_runs=num_runs, seed=i, **scenario.workload)
+        run_file = workload.write_run_file(os.path.join(work_dir, f'run_queue_{i + 1}'), i + 1, spec,
+                                           user_plus_machines, data_dir)
+        scheduler.submit(run_file)
+        run_files.append(run_file)
+
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        scheduler.run(max_runs_per_cycle=max_runs_per_cycle)
+    wall, cpu = time.perf_counter() - start_wall, time.process_time() - start_cpu
+    for run_file in run_files:
+        run_file_utils.purge_if_empty(run_file)
+
+    cpu_utilization, ram_utilization, gpu_ram_utilization = cluster.utilization()
+    return {
+        'scenario': scenario.name,
+        'hosts': scenario.num_hosts,
+        'runs': scenario.num_runs,
+        'launches': cluster.launches,
+        'failures': cluster.failures,
+        'oom_kills': cluster.oom_kills,
+        'makespan_s': cluster.makespan,
+        'queue_wait_p50_s': _percentile(cluster.queue_waits, 50),
+        'queue_wait_p95_s': _percentile(cluster.queue_waits, 95),
+        'dispatch_latency_p50_s': _percentile(cluster.dispatch_latencies, 50),
+        'dispatch_latency_p95_s': _percentile(cluster.dispatch_latencies, 95),
+        'cpu_utilization': cpu_utilization,
+        'ram_utilization': ram_utilization,
+        'gpu_ram_utilization': gpu_ram_utilization,
+        'cpu_oversubscription': cluster.cpu_oversubscription(),
+        'cycles': len(scheduler.cycle_times),
+        'cycle_p50_ms': _percentile([t * 1000 for t in scheduler.cycle_times], 50),
+        'cycle_p95_ms': _percentile([t * 1000 for t in scheduler.cycle_times], 95),
+        'scheduler_cpu_s': cpu,
+        'wall_s': wall,
+    }
+
+
+def _format_value(value: Any) -> str:
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return f'{value:.3g}'
+    return str(value)
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    for result in results:
+        print(result['scenario'])
+        for key, value in result.items():
+            if key != 'scenario':
+                print(f'  {key:<24}{_format_value(value)}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', type=str, default=None,
+                        help=f'comma separated, any of {", ".join(s.name for s in SCENARIOS)}. defaults to all.')
+    parser.add_argument('--max_runs', type=int, default=None, help='skip scenarios with more runs than this.')
+    parser.add_argument('--json', type=str, default=None, help='append one JSON line per scenario to this file.')
+    parser.add_argument('--backfill_window', type=int, default=64)
+    parser.add_argument('--max_runs_per_cycle', type=int, default=256)
+    parser.add_argument('--metrics_file', type=str, default=None,
+                        help='scheduler metrics export, .jsonl collects every scenario, a Prometheus file the last.')
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS
+    if args.scenarios is not None:
+        by_name = {s.name: s for s in SCENARIOS}
+        scenarios = [by_name[name] for name in args.scenarios.split(',')]
+    if args.max_runs is not None:
+        scenarios = [s for s in scenarios if s.num_runs <= args.max_runs]
+    results = []
+    for scenario in scenarios:
+        with tempfile.TemporaryDirectory() as work_dir:
+            result = run_scenario(scenario, work_dir, max_runs_per_cycle=args.max_runs_per_cycle,
+                                  backfill_window=args.backfill_window, metrics_file=args.metrics_file)
+        results.append(result)
+        print_results([result])
+        if args.json is not None:
+            with open(args.json, 'a') as f:
+                f.write(json.dumps(result) + '\n')
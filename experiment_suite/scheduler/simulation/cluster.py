@@ -0,0 +1,415 @@
+import collections
+import heapq
+import io
+import itertools
+import os
+import pickle
+import random
+import re
+import shlex
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, IO, List, Mapping, Optional, Tuple
+
+from experiment_suite import status_index
+from experiment_suite.scheduler import events
+from experiment_suite.scheduler import footprint
+from experiment_suite.scheduler.clients import ClientWrapper, FileContents
+from experiment_suite.scheduler.clock import Clock
+from experiment_suite.scheduler.simulation import workload
+
+'''
+A cluster of simulated machines for driving RunScheduler without ssh.
+Machines answer the remote executables the scheduler runs (get_monitor_data, get_xid_info,
+create_experiment, run_wrapper) from in-memory state, and launched runs play out on the
+cluster's virtual clock: a run starts launch_delay after it is launched, holds its peak
+footprint from spin_up_time on, and exits after its duration. A run that spins up on a
+machine without room for its footprint is killed as if by the OOM killer. Spun up runs
+sharing oversubscribed cores slow down in proportion, e.g. runs wanting 48 of 32 cores
+progress at two thirds of their speed, and busy cores are capped at the machine's when accounting.
+'''
+
+GiB = 1024 ** 3
+
+# the scheduler's run watchers turn every line a run reports into one of these.
+_WATCHER_EVENTS = {events.SPUN_UP, events.FINISHED, events.RUN_EXITED}
+
+OOM_RETCODE = 137
+
+
+@dataclass
+class MachineSpec:
+    cpus: int = 32
+    ram: int = 128 * GiB
+    gpus: int = 0
+    gpu_ram: int = 24 * GiB
+
+
+def make_machines(num_hosts: int, spec: MachineSpec) -> Dict[str, MachineSpec]:
+    # the scheduler maps run hostnames back to addresses under eecs.umich.edu.
+    return {f'sim{i:04d}.eecs.umich.edu': spec for i in range(num_hosts)}
+
+
+class SimulationTimeout(Exception):
+    pass
+
+
+class RunChannel:
+    # stands in for run_wrapper's stdout, the scheduler's watcher thread blocks in readline until the run exits.
+
+    def __init__(self):
+        self._lines: Deque[str] = collections.deque()
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def write_line(self, line: str, close: bool = False) -> None:
+        with self._condition:
+            self._lines.append(line + '\n')
+            self._closed = close
+            self._condition.notify_all()
+
+    def readline(self) -> str:
+        with self._condition:
+            self._condition.wait_for(lambda: self._lines or self._closed)
+            return self._lines.popleft() if self._lines else ''
+
+
+@dataclass
+class SimulatedRun:
+    xid: int
+    run_num: int
+    xid_dir: str
+    gpu: Optional[int]
+    behaviour: workload.RunBehaviour
+    fails: bool
+    channel: RunChannel = field(default_factory=RunChannel)
+    spun_up: bool = False
+    exited: bool = False
+    # seconds the run still has to go at full speed, as of progress_at.
+    work_left: float = 0.0
+    progress_at: float = 0.0
+    # bumped whenever the run's exit is rescheduled, earlier exits on the timeline are void.
+    exit_version: int = 0
+
+
+class SimulatedMachine:
+
+    def __init__(self, addr: str, spec: MachineSpec):
+        self.addr = addr
+        self.hostname = addr.split('.')[0]
+        self.spec = spec
+        self.used_cores = 0.0
+        self.used_ram = 0
+        self.used_gpu_ram = [0] * spec.gpus
+        self.spun_up_runs: List[SimulatedRun] = []
+        # when the machine last lost a run that no launch has followed yet.
+        self.freed_at: Optional[float] = None
+        self.status: Dict[int, Dict[int, Dict[str, Any]]] = dict()
+        self.files: Dict[str, bytes] = dict()
+
+    def monitor_data(self) -> Dict[str, float]:
+        data = {
+            'idle_cpu': 100.0 * max(0.0, 1 - self.used_cores / self.spec.cpus),
+            'free_mem': max(0, self.spec.ram - self.used_ram),
+            'total_mem': self.spec.ram,
+            'num_cpus': self.spec.cpus,
+        }
+        for gpu in range(self.spec.gpus):
+            data[f'gpu{gpu}-mem-free'] = max(0, self.spec.gpu_ram - self.used_gpu_ram[gpu])
+            data[f'gpu{gpu}-mem-total'] = self.spec.gpu_ram
+        return data
+
+    def speed(self) -> float:
+        # the share of its cores every spun up run gets.
+        return min(1.0, self.spec.cpus / self.used_cores) if self.used_cores > 0 else 1.0
+
+    def oversubscribed_cores(self) -> float:
+        return max(0.0, self.used_cores - self.spec.cpus)
+
+    def busy(self) -> Tuple[float, int, int]:
+        # what the machine actually delivers, an oversubscribed machine is only ever fully busy.
+        return (min(self.used_cores, self.spec.cpus), min(self.used_ram, self.spec.ram),
+                sum(min(used, self.spec.gpu_ram) for used in self.used_gpu_ram))
+
+
+class SimulatedClient(ClientWrapper):
+
+    def __init__(self, cluster: 'SimulatedCluster', addr: str):
+        self._cluster = cluster
+        self._addr = addr
+
+    def exec_command(self, command: str) -> Tuple[IO, IO, IO]:
+        return self._cluster.exec_command(self._addr, command)
+
+    def put_files(self, files: Mapping[str, FileContents], mode: int = 0o644) -> None:
+        machine = self._cluster.machines[self._addr]
+        for path, contents in files.items():
+            machine.files[path] = contents.encode() if isinstance(contents, str) else contents
+
+    def get_file(self, path: str) -> bytes:
+        return self._cluster.machines[self._addr].files[path]
+
+
+class SimulatedClock(Clock):
+
+    def __init__(self, cluster: 'SimulatedCluster', horizon: float, watcher_timeout: float = 60):
+        # horizon: virtual seconds after which the simulation is abandoned, e.g. a run that fits nowhere.
+        # watcher_timeout: real seconds to wait for the scheduler's threads to pick up run events.
+        self._cluster = cluster
+        self._horizon = horizon
+        self._watcher_timeout = watcher_timeout
+        self._now = 0.0
+
+    def time(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+        # whatever falls due meanwhile fires on the next wait, at its own time.
+        self._advance(self._now + seconds)
+
+    def wait(self, scheduler_events: events.SchedulerEvents, timeout: float) -> List[str]:
+        if reasons := scheduler_events.wait(0):
+            return reasons
+        deadline = self._now + timeout
+        while True:
+            if expected := self._cluster.fire_due(self._now):
+                return self._collect(scheduler_events, expected)
+            next_time = self._cluster.next_event_time()
+            if next_time is None or next_time > deadline:
+                self._advance(deadline)
+                return []
+            self._advance(next_time)
+
+    def _collect(self, scheduler_events: events.SchedulerEvents, expected: int) -> List[str]:
+        # time stands still until every line the runs wrote has reached the scheduler, so a
+        # simulation does not depend on how its threads happen to be scheduled.
+        reasons = []
+        while expected > 0:
+            woken = scheduler_events.wait(self._watcher_timeout)
+            if not woken:
+                raise Exception(f'The scheduler did not pick up {expected} run events within '
+                                f'{self._watcher_timeout}s.')
+            reasons.extend(woken)
+            expected -= sum(1 for reason in woken if reason in _WATCHER_EVENTS)
+        return reasons
+
+    def _advance(self, to: float) -> None:
+        if to > self._horizon:
+            raise SimulationTimeout(f'Simulation ran past {self._horizon}s of virtual time.')
+        self._now = max(self._now, to)
+
+
+class SimulatedCluster:
+
+    def __init__(
+            self,
+            machines: Mapping[str, MachineSpec],
+            shared_data_dir: bool = True,
+            launch_delay: float = 5,
+            spin_up_time: float = 60,
+            horizon: float = 30 * 24 * 60 * 60,
+            seed: int = 0,
+    ):
+        # shared_data_dir: runs report into status indexes and footprint files under their data dir,
+        # as on a data dir the scheduler can read. otherwise the scheduler polls get_xid_info.
+        self.machines = {addr: SimulatedMachine(addr, spec) for addr, spec in machines.items()}
+        self.clock = SimulatedClock(self, horizon)
+        self._shared_data_dir = shared_data_dir
+        self._launch_delay = launch_delay
+        self._spin_up_time = spin_up_time
+        self._seed = seed
+        # launches come in from the scheduler's launch threads.
+        self._lock = threading.Lock()
+        self._timeline: List[Tuple[float, int, Callable[[float], int]]] = []
+        self._sequence = itertools.count()
+        self.capacity = (
+            sum(m.spec.cpus for m in self.machines.values()),
+            sum(m.spec.ram for m in self.machines.values()),
+            sum(m.spec.gpus * m.spec.gpu_ram for m in self.machines.values()),
+        )
+        self._busy = [0.0, 0.0, 0.0]
+        self._busy_time = [0.0, 0.0, 0.0]
+        # cores asked for beyond what machines have, and its integral over time.
+        self._oversubscribed = 0.0
+        self._oversubscribed_time = 0.0
+        self._accounted_at = 0.0
+        self.launches = 0
+        self.failures = 0
+        self.oom_kills = 0
+        self.makespan = 0.0
+        # virtual time at which each run was first launched, everything is submitted at time 0.
+        self.queue_waits: List[float] = []
+        # per launch, how long its machine had room from a run exiting before the scheduler used it.
+        self.dispatch_latencies: List[float] = []
+
+    def client(self, addr: str) -> SimulatedClient:
+        return SimulatedClient(self, addr)
+
+    def utilization(self) -> Tuple[float, float, float]:
+        # cpu, ram and gpu ram busy over the makespan, as fractions of the cluster's capacity.
+        return tuple(busy / (capacity * self.makespan) if capacity and self.makespan else 0.0
+                     for busy, capacity in zip(self._busy_time, self.capacity))
+
+    def cpu_oversubscription(self) -> float:
+        # core seconds runs wanted beyond their machines' cores, as a fraction of the cluster's over the makespan.
+        cpu_capacity = self.capacity[0]
+        return self._oversubscribed_time / (cpu_capacity * self.makespan) if cpu_capacity and self.makespan else 0.0
+
+    def exec_command(self, addr: str, command: str) -> Tuple[IO, IO, IO]:
+        m = re.search(r'remote_executables\.(\w+)(.*)$', command)
+        if m is None:
+            # e.g. the liveness check for a run whose channel dropped, which simulated channels never do.
+            return io.BytesIO(), io.BytesIO(), io.BytesIO()
+        remote_exec, args = m.group(1), shlex.split(m.group(2))
+        machine = self.machines[addr]
+        if remote_exec == 'run_wrapper':
+            return io.BytesIO(), self._launch(machine, args), io.BytesIO()
+        with self._lock:
+            if remote_exec == 'get_monitor_data':
+                out = machine.monitor_data()
+            elif remote_exec == 'get_xid_info':
+                out = {str(run_num): dict(status) for run_num, status in machine.status.get(int(args[1]), {}).items()}
+            elif remote_exec == 'create_experiment':
+                out = {'experiment_dir': os.path.join(args[0], f'{args[1]}_{args[2]}_{args[4]}')}
+            else:
+                raise Exception(f'Simulated machines cannot run {remote_exec}.')
+        return io.BytesIO(), io.BytesIO(pickle.dumps(out, 0)), io.BytesIO()
+
+    def _launch(self, machine: SimulatedMachine, args: List[str]) -> RunChannel:
+        data_dir, _, _, xid, run_num, _, _, experiment_arg_string, environ_vars, attempt = args
+        environ = dict(var.split('=', 1) for var in environ_vars.split(',') if var)
+        gpu = int(environ['CUDA_VISIBLE_DEVICES']) if 'CUDA_VISIBLE_DEVICES' in environ else None
+        behaviour = workload.parse_behaviour(experiment_arg_string)
+        # decided per attempt and independent of launch order, so simulations repeat exactly.
+        rng = random.Random(f'{self._seed}-{xid}-{run_num}-{attempt}')
+        run = SimulatedRun(xid=int(xid), run_num=int(run_num), xid_dir=os.path.join(os.path.expanduser(data_dir), xid),
+                           gpu=gpu, behaviour=behaviour, fails=rng.random() < behaviour.failure_rate)
+        with self._lock:
+            now = self.clock.time()
+            self.launches += 1
+            if attempt == '0':
+                self.queue_waits.append(now)
+            if machine.freed_at is not None:
+                self.dispatch_latencies.append(now - machine.freed_at)
+                machine.freed_at = None
+            self._schedule(now + self._launch_delay, lambda at: self._start(machine, run, at))
+        return run.channel
+
+    def _schedule(self, at: float, action: Callable[[float], int]) -> None:
+        heapq.heappush(self._timeline, (at, next(self._sequence), action))
+
+    def next_event_time(self) -> Optional[float]:
+        with self._lock:
+            return self._timeline[0][0] if self._timeline else None
+
+    def fire_due(self, now: float) -> int:
+        # returns how many events the fired actions will raise in the scheduler.
+        expected = 0
+        with self._lock:
+            while self._timeline and self._timeline[0][0] <= now:
+                at, _, action = heapq.heappop(self._timeline)
+                self._account(at)
+                expected += action(at)
+        return expected
+
+    def _account(self, now: float) -> None:
+        elapsed = now - self._accounted_at
+        if elapsed > 0:
+            for i, busy in enumerate(self._busy):
+                self._busy_time[i] += busy * elapsed
+            self._oversubscribed_time += self._oversubscribed * elapsed
+            self._accounted_at = now
+
+    def _progress(self, run: SimulatedRun, now: float, speed: float) -> None:
+        run.work_left = max(0.0, run.work_left - (now - run.progress_at) * speed)
+        run.progress_at = now
+
+    def _schedule_exit(self, machine: SimulatedMachine, run: SimulatedRun, now: float, speed: float) -> None:
+        run.exit_version += 1
+        version = run.exit_version
+
+        def exit_action(at: float) -> int:
+            if run.exit_version != version:
+                return 0
+            return self._exit(machine, run, at, 1 if run.fails else 0)
+
+        self._schedule(now + run.work_left / speed, exit_action)
+
+    def _use(self, machine: SimulatedMachine, run: SimulatedRun, sign: int, now: float) -> None:
+        # a run spinning up or exiting changes how fast every spun up run on the machine goes.
+        old_speed = machine.speed()
+        for other in machine.spun_up_runs:
+            self._progress(other, now, old_speed)
+        if sign > 0:
+            machine.spun_up_runs.append(run)
+        else:
+            machine.spun_up_runs.remove(run)
+        before = machine.busy()
+        oversubscribed_before = machine.oversubscribed_cores()
+        machine.used_cores += sign * run.behaviour.cores
+        machine.used_ram += sign * run.behaviour.peak_ram
+        if run.gpu is not None:
+            machine.used_gpu_ram[run.gpu] += sign * run.behaviour.peak_gpu_ram
+        for i, (old, new) in enumerate(zip(before, machine.busy())):
+            self._busy[i] += new - old
+        self._oversubscribed += machine.oversubscribed_cores() - oversubscribed_before
+        new_speed = machine.speed()
+        for other in machine.spun_up_runs:
+            if other is run or new_speed != old_speed:
+                self._schedule_exit(machine, other, now, new_speed)
+
+    def _report(self, machine: SimulatedMachine, run: SimulatedRun, progress: float, spun_up: bool) -> None:
+        status = {'progress': progress, 'spun_up': spun_up, 'hostname': machine.hostname}
+        if progress == 1:
+            # what get_xid_info attaches from footprint.txt.
+            status['peak_ram'] = run.behaviour.peak_ram
+            status['peak_gpu_ram'] = None if run.gpu is None else run.behaviour.peak_gpu_ram
+        machine.status.setdefault(run.xid, dict())[run.run_num] = status
+        if not self._shared_data_dir:
+            return
+        status_index.update(run.xid_dir, run.run_num, progress=progress, spun_up=spun_up, hostname=machine.hostname)
+        if progress == 1:
+            run_path = os.path.join(run.xid_dir, str(run.run_num))
+            os.makedirs(run_path, exist_ok=True)
+            peak_gpu_ram = '-' if status['peak_gpu_ram'] is None else str(status['peak_gpu_ram'])
+            with open(os.path.join(run_path, footprint.FOOTPRINT_FILE), 'w') as f:
+                f.write(f'{run.behaviour.peak_ram} {peak_gpu_ram}')
+
+    def _start(self, machine: SimulatedMachine, run: SimulatedRun, now: float) -> int:
+        self._report(machine, run, 0.0, False)
+        duration = run.behaviour.duration
+        run.work_left, run.progress_at = duration, now
+        self._schedule(now + min(self._spin_up_time, duration), lambda at: self._spin_up(machine, run, at))
+        # until it spins up, a run goes at full speed.
+        self._schedule_exit(machine, run, now, 1.0)
+        return 0
+
+    def _spin_up(self, machine: SimulatedMachine, run: SimulatedRun, now: float) -> int:
+        if run.exited:
+            return 0
+        run.spun_up = True
+        self._progress(run, now, 1.0)
+        self._use(machine, run, 1, now)
+        out_of_memory = machine.used_ram > machine.spec.ram or (
+                run.gpu is not None and machine.used_gpu_ram[run.gpu] > machine.spec.gpu_ram)
+        if out_of_memory:
+            self.oom_kills += 1
+            return self._exit(machine, run, now, OOM_RETCODE)
+        self._report(machine, run, 0.0, True)
+        run.channel.write_line(events.format_event(events.SPUN_UP, str(run.run_num)))
+        return 1
+
+    def _exit(self, machine: SimulatedMachine, run: SimulatedRun, now: float, retcode: int) -> int:
+        if run.exited:
+            return 0
+        run.exited = True
+        if run.spun_up:
+            self._use(machine, run, -1, now)
+        if machine.freed_at is None:
+            machine.freed_at = now
+        self.failures += retcode != 0
+        self.makespan = max(self.makespan, now)
+        self._report(machine, run, 1.0 if retcode == 0 else -1.0, run.spun_up)
+        run.channel.write_line(events.format_event(events.FINISHED, str(run.run_num), str(retcode)), close=True)
+        # the finished line, then the closed channel.
+        return 2
@@ -0,0 +1,32 @@
+import time
+from typing import List, Optional, Tuple
+
+from experiment_suite.scheduler import placement
+from experiment_suite.scheduler.experiment import Experiment
+from experiment_suite.scheduler.run_scheduler import RunScheduler
+from experiment_suite.scheduler.simulation.cluster import SimulatedClient, SimulatedCluster
+from experiment_suite.scheduler.utils import Run
+
+
+class SimulatedScheduler(RunScheduler):
+    # the real scheduler on a simulated cluster's machines and virtual clock. monitor subscriptions
+    # stream on real time, so machines are polled every cycle instead.
+
+    def __init__(self, cluster: SimulatedCluster, run_file: Optional[str] = None, **kwargs):
+        self._cluster = cluster
+        # wall time each scheduling cycle spent polling machines and placing runs.
+        self.cycle_times: List[float] = []
+        super().__init__(run_file, use_monitor_agent=False, clock=cluster.clock, **kwargs)
+
+    def _connect_to_machine(self, user_plus_machine: str) -> SimulatedClient:
+        return self._cluster.client(user_plus_machine.split('@')[1])
+
+    def _place_runs(
+            self,
+            experiments: List[Experiment],
+            candidates: List[Tuple[placement.CandidateKey, Run]],
+    ) -> List[placement.Placement]:
+        start = time.perf_counter()
+        placements = super()._place_runs(experiments, candidates)
+        self.cycle_times.append(time.perf_counter() - start)
+        return placements
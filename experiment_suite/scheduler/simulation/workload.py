@@ -0,0 +1,108 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from experiment_suite.scheduler import run_queue
+from experiment_suite.scheduler.utils import RunRecord, RunTemplate
+
+'''
+Synthetic runs carry how they behave on a simulated machine in their experiment arguments,
+so they go through run files, the scheduler and run_wrapper's command line like real runs:
+--sim_duration : seconds from start to exit.
+--sim_cores : cores the run keeps busy once spun up.
+--sim_peak_ram, --sim_peak_gpu_ram : bytes the run holds once spun up.
+--sim_failure_rate : chance each attempt exits with an error.
+'''
+
+GiB = 1024 ** 3
+
+ARG_NAMES = ('sim_duration', 'sim_cores', 'sim_peak_ram', 'sim_peak_gpu_ram', 'sim_failure_rate')
+
+
+@dataclass
+class WorkloadSpec:
+    num_runs: int
+    mean_duration: float = 30 * 60
+    # durations are lognormal around the mean, sigma is that of the underlying normal.
+    duration_sigma: float = 0.5
+    cores: float = 4
+    required_ram: int = 8 * GiB
+    # runs peak at this fraction of required_ram on average, some go over what they asked for.
+    ram_use: float = 0.6
+    ram_use_sigma: float = 0.2
+    required_gpu_ram: Optional[int] = None
+    gpu_ram_use: float = 0.7
+    failure_rate: float = 0.0
+    seed: int = 0
+
+
+@dataclass
+class RunBehaviour:
+    duration: float
+    cores: float
+    peak_ram: int
+    peak_gpu_ram: int
+    failure_rate: float
+
+
+def parse_behaviour(experiment_arg_string: str) -> RunBehaviour:
+    args = dict(arg[2:].split('=', 1) for arg in experiment_arg_string.split() if arg.startswith('--sim_'))
+    return RunBehaviour(
+        duration=float(args['sim_duration']),
+        cores=float(args['sim_cores']),
+        peak_ram=int(args['sim_peak_ram']),
+        peak_gpu_ram=int(args['sim_peak_gpu_ram']),
+        failure_rate=float(args['sim_failure_rate']),
+    )
+
+
+def synthetic_records(spec: WorkloadSpec) -> Iterator[RunRecord]:
+    rng = np.random.default_rng(spec.seed)
+    n = spec.num_runs
+    # the lognormal's mu is shifted so that its mean, not its median, is mean_duration.
+    mu = np.log(spec.mean_duration) - spec.duration_sigma ** 2 / 2
+    durations = rng.lognormal(mu, spec.duration_sigma, n)
+    peak_ram = np.clip(rng.normal(spec.ram_use, spec.ram_use_sigma, n), 0.05, 1.5) * spec.required_ram
+    if spec.required_gpu_ram is None:
+        peak_gpu_ram = np.zeros(n)
+    else:
+        peak_gpu_ram = np.clip(rng.normal(spec.gpu_ram_use, spec.ram_use_sigma, n), 0.05, 1.5) * spec.required_gpu_ram
+    for run_num in range(n):
+        yield RunRecord(run_num, (round(float(durations[run_num]), 3), spec.cores, int(peak_ram[run_num]),
+                                  int(peak_gpu_ram[run_num]), spec.failure_rate))
+
+
+def write_run_file(
+        path: str,
+        xid: int,
+        spec: WorkloadSpec,
+        user_plus_machines: List[str],
+        data_dir: str,
+) -> str:
+    experiment_data_dir = os.path.join(data_dir, str(xid))
+    os.makedirs(experiment_data_dir, exist_ok=True)
+    metadata: Dict = {
+        'user_plus_machines': user_plus_machines,
+        'experiments_dir': os.path.join(data_dir, 'experiments'),
+        'data_dir': data_dir,
+        'venv_name': 'venv',
+        'xid': xid,
+        'github_ssh_link': 'git@github.com:simulated/experiment.git',
+        'git_commit': None,
+        'run_template': RunTemplate(
+            required_ram=spec.required_ram,
+            required_gpu_ram=spec.required_gpu_ram,
+            data_dir=data_dir,
+            venv_name='venv',
+            xid=xid,
+            pythonpath='.',
+            experiment_file='main.py',
+            experiment_environ_vars='',
+            experiment_data_dir=experiment_data_dir,
+            arg_names=ARG_NAMES,
+            required_cpus=spec.cores,
+        ),
+    }
+    return run_queue.write_run_queue(path, metadata, (record.to_tuple() for record in synthetic_records(spec)))
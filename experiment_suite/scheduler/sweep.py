@@ -1,9 +1,11 @@
-import itertools
-from typing import List, Callable, Dict, Optional, Iterable, Union, TypeVar
-from experiment_suite.scheduler.utils import Run
+from typing import List, Callable, Dict, Optional, Iterable, Union, TypeVar, Tuple
+from experiment_suite.scheduler.utils import RunRecord, RunTemplate, kwargs_to_str, process_kw_value_pair
+from experiment_suite.scheduler import run_queue
+from experiment_suite.scheduler import git_mirror
+from experiment_suite.scheduler import grid as grid_lib
+import numpy as np  # available to array filters in sweep files.
 import time
 import os
-import pickle
 import sys
 
 T = TypeVar('T')
@@ -17,6 +19,7 @@ class Sweep:
     def __init__(self):
         self._sweep_args: Dict[str, List[Primitive]] = dict()
         self._filters: List[KwargFilter] = []
+        self._array_filters: List[grid_lib.ArrayFilter] = []
         self._enum_funcs: Dict[str, Callable[[int], Primitive]] = dict()
         self._used_names = set()
 
@@ -28,6 +31,8 @@ class Sweep:
             new_sweep.add_enumeration(name, vals)
         for f in self._filters:
             new_sweep.add_filter(f)
+        for f in self._array_filters:
+            new_sweep.add_array_filter(f)
         return new_sweep
 
     def add_product(
@@ -55,30 +60,42 @@ class Sweep:
     ) -> None:
         self._filters.append(filter_func)
 
-    def __iter__(self) -> Iterable[Kwargs]:
-        sorted_items = sorted(list(self._sweep_args.items()), key=lambda x: x[0])
-        arg_pairs = [[(name, arg) for arg in args]
-                     for name, args in sorted_items]
-        for i, prod in enumerate(itertools.product(*arg_pairs)):
-            prod_dict = dict(prod)
-            enum_dict = dict([(name, f(i)) for name, f in self._enum_funcs.items()])
-            combined_dict = {**prod_dict, **enum_dict}
-            if all(f(combined_dict) for f in self._filters):
-                yield combined_dict
-
-
-def process_kw_value_pair(
-        kw: str,
-        value: str
-) -> str:
-    if isinstance(value, bool):
-        return f'--{kw}' if value else ''
-    else:
-        return f'--{kw}={value}'
+    def grid_size(self) -> int:
+        # number of product points before filters, computed without enumerating the grid.
+        size = 1
+        for values in self._sweep_args.values():
+            size *= len(values)
+        return size
+
+    def add_array_filter(
+            self,
+            filter_func: grid_lib.ArrayFilter
+    ) -> None:
+        # e.g. add_array_filter(lambda c: c["lr"] * c["batch_size"] < 1) evaluates the whole grid at once.
+        self._array_filters.append(filter_func)
+
+    def _grid(self) -> grid_lib.Grid:
+        return grid_lib.Grid(self._sweep_args)
 
+    def kwargs_at(self, i: int) -> Kwargs:
+        # random access by run index, ignoring filters.
+        kwargs = self._grid().kwargs_at(i)
+        kwargs.update((name, f(i)) for name, f in self._enum_funcs.items())
+        return kwargs
 
-def kwargs_to_str(kwargs: Kwargs) -> str:
-    return ' '.join(process_kw_value_pair(name, kwarg) for name, kwarg in kwargs.items())
+    def arg_names(self) -> Tuple[str, ...]:
+        return tuple(sorted(self._sweep_args.keys())) + tuple(self._enum_funcs.keys())
+
+    def iter_indexed_chunks(self, chunk_size: int = 65536) -> Iterable[List[Tuple[int, Kwargs]]]:
+        return self._grid().iter_chunks(self._array_filters, self._filters, self._enum_funcs, chunk_size)
+
+    def iter_chunks(self, chunk_size: int = 65536) -> Iterable[List[Kwargs]]:
+        for chunk in self.iter_indexed_chunks(chunk_size):
+            yield [kwargs for _, kwargs in chunk]
+
+    def __iter__(self) -> Iterable[Kwargs]:
+        for chunk in self.iter_chunks():
+            yield from chunk
 
 
 def build_run_file(
@@ -95,6 +112,9 @@ def build_run_file(
         pythonpath: str,
         experiment_file: str,
         github_ssh_link: str,
+        chunk_size: int = 1000,
+        on_first_chunk: Optional[Callable[[str], None]] = None,
+        required_cpus: float = 1,
 ) -> str:
     xid = int(time.time())
     run_file_data = {
@@ -106,6 +126,8 @@ def build_run_file(
         #'username': username,
         'xid': xid,
         'github_ssh_link': github_ssh_link,
+        # every run checks out the commit the sweep was launched from.
+        'git_commit': git_mirror.resolve_remote_head(github_ssh_link),
     }
     # set up data directory for experiment.
     experiment_data_dir = os.path.join(shared_data_dir, str(xid))
@@ -114,36 +136,48 @@ def build_run_file(
     os.mkdir(experiment_data_dir)
     # move the temporary sweep file
     os.rename(tmp_sweep_path, os.path.join(experiment_data_dir, 'sweep.py'))
-    run_file_path = os.path.join(experiment_data_dir, 'run_file.pickle')
-
+    run_file_path = os.path.join(experiment_data_dir, 'run_queue')
+
+    # run_idx and data_path are derived from the run number when a run is dispatched.
+    arg_names = sweep.arg_names()
+    run_file_data['run_template'] = RunTemplate(
+        required_ram=required_ram,
+        required_gpu_ram=required_gpu_ram,
+        data_dir=shared_data_dir,
+        venv_name=venv_name,
+        xid=xid,
+        pythonpath=pythonpath,
+        experiment_file=experiment_file,
+        experiment_environ_vars='',
+        experiment_data_dir=experiment_data_dir,
+        arg_names=arg_names,
+        required_cpus=required_cpus,
+    )
+
+    # filters still see run_idx and data_path, the records only keep the sweep's own arguments.
     sweep = sweep.copy()
     sweep.add_enumeration('run_idx', lambda i: i)
     sweep.add_enumeration('data_path', lambda i: os.path.join(experiment_data_dir, str(i)))
 
-    runs = []
-    for kwargs in sweep:
-        run = Run(
-            required_ram=required_ram,
-            required_gpu_ram=required_gpu_ram,
-            data_dir=shared_data_dir,
-            venv_name=venv_name,
-            xid=xid,
-            run_num=kwargs['run_idx'],
-            pythonpath=pythonpath,
-            experiment_file=experiment_file,
-            experiment_arg_string=kwargs_to_str(kwargs),
-            experiment_environ_vars='',
-        )
-        runs.append((False, run))
-    run_file_data['runs'] = runs
-    with open(run_file_path, 'wb') as f:
-        pickle.dump(run_file_data, f)
+    # runs are written in chunks, the scheduler can start dispatching once the first one is flushed.
+    with run_queue.RunQueueWriter(run_file_path, run_file_data) as writer:
+        for chunk in sweep.iter_indexed_chunks(chunk_size):
+            for run_num, kwargs in chunk:
+                writer.append(RunRecord(run_num, tuple(kwargs[name] for name in arg_names)).to_tuple())
+            writer.flush()
+            if on_first_chunk is not None:
+                on_first_chunk(experiment_data_dir)
+                on_first_chunk = None
+    if on_first_chunk is not None:
+        on_first_chunk(experiment_data_dir)
     return experiment_data_dir
 
 
 def build_run_file_from_sweep_file(
         sweep_file_path: str,
         machine_file_path: str,
+        chunk_size: int = 1000,
+        on_first_chunk: Optional[Callable[[str], None]] = None,
 ) -> str:
     with open(machine_file_path, 'r') as f:
         user_plus_machines = f.readlines()
@@ -170,4 +204,7 @@ def build_run_file_from_sweep_file(
         pythonpath=p['pythonpath'],
         experiment_file=p['experiment_file'],
         github_ssh_link=p['github_ssh_link'],
+        chunk_size=chunk_size,
+        on_first_chunk=on_first_chunk,
+        required_cpus=p.get('required_cpus', 1),
     )
\ No newline at end of file
@@ -1,7 +1,7 @@
 import socket
 from contextlib import closing
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Tuple, Any, Dict
 import os
 import paramiko
 
@@ -18,6 +18,67 @@ class Run:
     experiment_file: str
     experiment_arg_string: str
     experiment_environ_vars: str
+    # cores the run keeps busy, taken off a host's idle cpu as runs are placed on it.
+    required_cpus: float = 1
+
+
+def process_kw_value_pair(
+        kw: str,
+        value: str
+) -> str:
+    if isinstance(value, bool):
+        return f'--{kw}' if value else ''
+    else:
+        return f'--{kw}={value}'
+
+
+def kwargs_to_str(kwargs: Dict[str, Any]) -> str:
+    return ' '.join(process_kw_value_pair(name, kwarg) for name, kwarg in kwargs.items())
+
+
+class RunRecord:
+    # the only per-run state in a run file: everything else lives once in its RunTemplate.
+    __slots__ = ('run_num', 'values')
+
+    def __init__(self, run_num: int, values: Tuple[Any, ...]):
+        self.run_num = run_num
+        self.values = values
+
+    def to_tuple(self) -> Tuple[int, Tuple[Any, ...]]:
+        return self.run_num, self.values
+
+
+@dataclass
+class RunTemplate:
+    required_ram: int
+    required_gpu_ram: Optional[int]
+    data_dir: str
+    venv_name: str
+    xid: int
+    pythonpath: str
+    experiment_file: str
+    experiment_environ_vars: str
+    experiment_data_dir: str
+    arg_names: Tuple[str, ...]
+    required_cpus: float = 1
+
+    def build(self, record: RunRecord) -> Run:
+        kwargs = dict(zip(self.arg_names, record.values))
+        kwargs['run_idx'] = record.run_num
+        kwargs['data_path'] = os.path.join(self.experiment_data_dir, str(record.run_num))
+        return Run(
+            required_ram=self.required_ram,
+            required_gpu_ram=self.required_gpu_ram,
+            data_dir=self.data_dir,
+            venv_name=self.venv_name,
+            xid=self.xid,
+            run_num=record.run_num,
+            pythonpath=self.pythonpath,
+            experiment_file=self.experiment_file,
+            experiment_arg_string=kwargs_to_str(kwargs),
+            experiment_environ_vars=self.experiment_environ_vars,
+            required_cpus=self.required_cpus,
+        )
 
 
 def get_hostname() -> str:
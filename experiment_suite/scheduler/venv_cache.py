@@ -0,0 +1,146 @@
+import contextlib
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+import time
+from typing import Iterator, List, Tuple
+
+from experiment_suite import const
+
+'''
+<cache_root>/
+-- <key>/ : a virtual environment, key = sha256 of the python version and requirements file.
+-- -- .complete : written once the environment is fully installed.
+-- -- .size : size of the environment in bytes.
+-- <key>.build.lock : held exclusively while an environment is built or evicted.
+-- <key>.use.lock : held shared by every run using the environment.
+The mtime of <key>.use.lock records when the environment was last handed out (LRU order).
+'''
+
+_COMPLETE_FILE = '.complete'
+_SIZE_FILE = '.size'
+
+
+@contextlib.contextmanager
+def _locked(path: str, mode: int) -> Iterator[int]:
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, mode)
+        yield fd
+    finally:
+        os.close(fd)
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
+            if not os.path.islink(file_path):
+                total += os.path.getsize(file_path)
+    return total
+
+
+def environment_key(requirements_path: str, python_command: str) -> str:
+    p = subprocess.run(f'{python_command} --version', shell=True, executable='/bin/bash',
+                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if p.returncode != 0:
+        raise Exception(f'Failed to get version of {python_command}: {p.stdout.decode()}.')
+    h = hashlib.sha256(p.stdout.strip())
+    with open(requirements_path, 'rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def hold(env_path: str) -> int:
+    # keeps a cached environment from being evicted until the returned fd is closed.
+    fd = os.open(env_path.rstrip('/') + '.use.lock', os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_SH)
+    return fd
+
+
+class VenvCache:
+
+    def __init__(
+            self,
+            root: str,
+            max_bytes: int = 20 * const.GB,
+            min_idle_time: float = 60 * 60,
+    ):
+        # min_idle_time protects environments handed out recently but not yet held by a run.
+        self._root = root
+        self._max_bytes = max_bytes
+        self._min_idle_time = min_idle_time
+        os.makedirs(root, exist_ok=True)
+
+    def _env_path(self, key: str) -> str:
+        return os.path.join(self._root, key)
+
+    def _is_complete(self, key: str) -> bool:
+        return os.path.isfile(os.path.join(self._env_path(key), _COMPLETE_FILE))
+
+    def _build(self, key: str, requirements_path: str, python_command: str) -> None:
+        env_path = self._env_path(key)
+        # a build interrupted halfway leaves an environment without a .complete marker.
+        shutil.rmtree(env_path, ignore_errors=True)
+        command = (f'{python_command} -m venv {env_path}; '
+                   f'source {env_path}/bin/activate; pip install -q -r {requirements_path}')
+        p = subprocess.run(command, shell=True, executable='/bin/bash',
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if p.returncode != 0:
+            shutil.rmtree(env_path, ignore_errors=True)
+            raise Exception(f'Failed to create virtual environment with error: {p.stderr.decode()}.')
+        with open(os.path.join(env_path, _SIZE_FILE), 'w') as f:
+            f.write(str(_directory_size(env_path)))
+        with open(os.path.join(env_path, _COMPLETE_FILE), 'w') as f:
+            pass
+
+    def get(self, requirements_path: str, python_command: str) -> str:
+        key = environment_key(requirements_path, python_command)
+        env_path = self._env_path(key)
+        if not self._is_complete(key):
+            # concurrent builds of the same key wait for the first one instead of racing it.
+            with _locked(env_path + '.build.lock', fcntl.LOCK_EX):
+                if not self._is_complete(key):
+                    self._build(key, requirements_path, python_command)
+                    self.evict(keep=key)
+        with open(env_path + '.use.lock', 'a'):
+            os.utime(env_path + '.use.lock')
+        return env_path
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for key in os.listdir(self._root):
+            if not self._is_complete(key):
+                continue
+            env_path = self._env_path(key)
+            with open(os.path.join(env_path, _SIZE_FILE), 'r') as f:
+                size = int(f.read())
+            last_used = os.path.getmtime(env_path + '.use.lock') if os.path.exists(env_path + '.use.lock') else 0
+            entries.append((last_used, size, key))
+        return sorted(entries)
+
+    def evict(self, keep: str = None) -> None:
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for last_used, size, key in entries:
+            if total <= self._max_bytes:
+                break
+            if key == keep or now - last_used < self._min_idle_time:
+                continue
+            env_path = self._env_path(key)
+            try:
+                with _locked(env_path + '.build.lock', fcntl.LOCK_EX | fcntl.LOCK_NB), \
+                        _locked(env_path + '.use.lock', fcntl.LOCK_EX | fcntl.LOCK_NB):
+                    os.remove(os.path.join(env_path, _COMPLETE_FILE))
+                    shutil.rmtree(env_path)
+            except BlockingIOError:
+                # a run is still using it, or another scheduler is building or evicting it.
+                continue
+            total -= size
+
+    def __contains__(self, key: str) -> bool:
+        return self._is_complete(key)
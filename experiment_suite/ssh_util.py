@@ -1,24 +1,33 @@
 import paramiko
-from typing import Union, List, Tuple
+import concurrent.futures
+import time
+from typing import Union, List, Tuple, Dict
 import os
 
+from experiment_suite.scheduler import clients
+
 
 def build_paramiko_client(
         user: str,
-        machine_address: str
+        machine_address: str,
+        timeout: float = 10,
+        max_attempts: int = 5,
+        max_backoff: float = 30,
 ) -> Tuple[str, paramiko.SSHClient]:
     client = paramiko.SSHClient()
     client.load_system_host_keys()
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    while True:
+    for attempt in range(max_attempts):
         try:
-            client.connect(machine_address, username=user)
+            client.connect(machine_address, username=user, timeout=timeout)
             break
-        except paramiko.ssh_exception.SSHException as e:
-            print(e)
-            print(f'({machine_address}) Trying again.')
-        except TimeoutError:
-            print('Timed out, trying again...')
+        except (paramiko.ssh_exception.SSHException, TimeoutError, OSError) as e:
+            if attempt == max_attempts - 1:
+                raise
+            backoff = min(max_backoff, 2 ** attempt)
+            print(f'({machine_address}) {e!r}, trying again in {backoff}s.')
+            time.sleep(backoff)
+    client.get_transport().set_keepalive(15)
     print(f'connected to {user}@{machine_address}')
     return machine_address, client
 
@@ -32,8 +41,10 @@ def build_paramiko_clients(
     else:
         assert len(machine_addresses) == len(user)
         user_list = user
-    return [build_paramiko_client(user, addr)
-            for user, addr in zip(user_list, machine_addresses)]
+    if not machine_addresses:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(machine_addresses)) as executor:
+        return list(executor.map(build_paramiko_client, user_list, machine_addresses))
 
 def ssh_run_command(
         name_and_client: Tuple[str, paramiko.SSHClient],
@@ -60,10 +71,15 @@ def ssh_write_file(
         file_path: str,
         contents: str,
         append: bool = False,
+        mode: int = 0o644,
 ) -> None:
-    contents = contents.replace('"', r'\"')
-    stream_op = '>>' if append else '>'
-    ssh_run_command(name_and_client, f'echo "{contents}" {stream_op} {file_path}')
+    _, client = name_and_client
+    with client.open_sftp() as sftp:
+        if append:
+            with sftp.open(clients.sftp_path(file_path), 'ab') as f:
+                f.write(contents.encode() + b'\n')
+        else:
+            clients.sftp_put_files(sftp, {file_path: contents + '\n'}, mode)
 
 
 
@@ -80,22 +96,64 @@ def get_authorized_keys(
     authorized_keys_text = ssh_read_file(name_and_client, '~/.ssh/authorized_keys')
     return authorized_keys_text.split('\n')
 
+def _key_identity(key: str) -> str:
+    # the same key may appear with different comments, only the type and key data identify it.
+    return ' '.join(key.split()[:2])
+
+
+def merge_keys(existing_keys: List[str], keys: List[str]) -> List[str]:
+    merged, seen = [], set()
+    for key in existing_keys + keys:
+        key = key.strip()
+        if not key or _key_identity(key) in seen:
+            continue
+        seen.add(_key_identity(key))
+        merged.append(key)
+    return merged
+
+
 # TODO figure out permission errors on RLDLs.
 def add_nonduplicate_keys(
         name_and_client: Tuple[str, paramiko.SSHClient],
         keys: List[str],
         make_backup: bool = True,
-) -> None:
-    if make_backup:
-        ssh_run_command(name_and_client, 'cp ~/.ssh/authorized_keys ~/temp_authorized_keys')
-    existing_keys = get_authorized_keys(name_and_client)
-    existing_keys = [e for e in existing_keys if e.strip()]
-    ssh_run_command(name_and_client, 'rm ~/.ssh/authorized_keys')
-    ssh_run_command(name_and_client, 'touch ~/.ssh/authorized_keys')
-    all_keys = set(keys).union(set(existing_keys))
-    all_keys = list(all_keys)
-    for key in all_keys:
-        ssh_write_file(name_and_client, '~/.ssh/authorized_keys', key, append=True)
+) -> int:
+    # one sftp session reads the current keys and writes the merged file back atomically,
+    # so a failure partway through leaves the old authorized_keys in place. returns the number of keys added.
+    _, client = name_and_client
+    with client.open_sftp() as sftp:
+        try:
+            existing_text = clients.sftp_get_file(sftp, '~/.ssh/authorized_keys').decode()
+        except FileNotFoundError:
+            existing_text = ''
+            try:
+                sftp.mkdir('.ssh', 0o700)
+            except IOError:
+                pass
+        existing_keys = existing_text.split('\n')
+        all_keys = merge_keys(existing_keys, keys)
+        files = {'~/.ssh/authorized_keys': '\n'.join(all_keys) + '\n'}
+        if make_backup:
+            files = {'~/temp_authorized_keys': existing_text, **files}
+        clients.sftp_put_files(sftp, files, mode=0o600)
+    return len(all_keys) - len(merge_keys(existing_keys, []))
+
+
+def sync_authorized_keys(
+        names_and_clients: List[Tuple[str, paramiko.SSHClient]],
+        keys: List[str],
+        make_backup: bool = True,
+) -> Dict[str, Union[int, Exception]]:
+    # every host is updated at once. maps each host to the number of keys added or the error it hit.
+    if not names_and_clients:
+        return dict()
+    results = dict()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(names_and_clients)) as executor:
+        future_to_name = {executor.submit(add_nonduplicate_keys, ncp, keys, make_backup): ncp[0]
+                          for ncp in names_and_clients}
+        for future, name in future_to_name.items():
+            results[name] = future.exception() or future.result()
+    return results
 
 
 def get_public_key(
@@ -133,7 +191,7 @@ if __name__ == '__main__':
     machines = [f'rldl{i}.eecs.umich.edu' for i in machine_numbers]
     user = 'crgrimm'
 
-    all_name_client_pairs = [build_paramiko_client(user, machine) for machine in machines]
+    all_name_client_pairs = build_paramiko_clients(user, machines)
     all_public_keys = [get_public_key(ncp) for ncp in all_name_client_pairs]
     with open(os.path.join(os.path.expanduser('~'), '.ssh/id_rsa.pub'), 'r') as f:
         local_public_key = f.read().strip()
@@ -143,8 +201,11 @@ if __name__ == '__main__':
     ]
     all_public_keys.extend(other_keys)
     print(len(all_public_keys))
-    for ncp in all_name_client_pairs:
-        add_nonduplicate_keys(ncp, all_public_keys)
+    for name, result in sync_authorized_keys(all_name_client_pairs, all_public_keys).items():
+        if isinstance(result, Exception):
+            print(f'({name}) Failed to sync keys: {result!r}')
+        else:
+            print(f'({name}) Added {result} keys.')
 
 
 
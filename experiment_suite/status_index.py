@@ -0,0 +1,154 @@
+import fcntl
+import os
+import struct
+from typing import Dict, Any, Optional, Tuple, Mapping
+
+import numpy as np
+
+'''
+<data_dir>/<xid>/status.log : per-experiment run status, updated by Manager and run_wrapper.
+-- header : magic, format version, next sequence number, number of records, records kept by the last compaction.
+-- records : (seq, run_num, fields, progress, spun_up, hostname), fixed size. fields is a bitmask of
+             the values the record sets, later records override earlier ones field by field.
+Writers append under an exclusive lock and bump the header after the record is written, so a
+reader that sees the header also sees every record it counts. Compaction rewrites the log into one
+record per run (keeping each run's latest sequence number) and renames it into place.
+'''
+
+STATUS_FILE = 'status.log'
+
+_MAGIC = b'XSTS'
+_VERSION = 1
+_HEADER = struct.Struct('<4sIQQQ')
+_RECORD = struct.Struct('<QIBdB64s')
+# the same record as a packed numpy dtype, for picking out records without unpacking them one by one.
+_RECORD_DTYPE = np.dtype([('seq', '<u8'), ('run_num', '<u4'), ('fields', 'u1'), ('progress', '<f8'),
+                          ('spun_up', 'u1'), ('hostname', 'S64')])
+
+PROGRESS = 1
+SPUN_UP = 2
+HOSTNAME = 4
+
+RunStatus = Dict[str, Any]
+
+
+def status_path(xid_dir: str) -> str:
+    return os.path.join(xid_dir, STATUS_FILE)
+
+
+def _open_locked(path: str) -> int:
+    # compaction renames a new log over the old one, so re-open if the locked file was replaced.
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+
+def _read_header(fd: int) -> Tuple[int, int, int]:
+    header = os.pread(fd, _HEADER.size, 0)
+    if len(header) < _HEADER.size:
+        return 1, 0, 0
+    magic, version, next_seq, num_records, compacted_records = _HEADER.unpack(header)
+    if magic != _MAGIC or version != _VERSION:
+        raise Exception(f'Not a version {_VERSION} status index.')
+    return next_seq, num_records, compacted_records
+
+
+def _merge(
+        statuses: Dict[int, RunStatus],
+        seqs: Dict[int, int],
+        data: bytes,
+        num_records: int,
+) -> None:
+    for i in range(num_records):
+        seq, run_num, fields, progress, spun_up, hostname = _RECORD.unpack_from(data, i * _RECORD.size)
+        status = statuses.setdefault(run_num, {'progress': 0.0, 'spun_up': False, 'hostname': ''})
+        if fields & PROGRESS:
+            status['progress'] = progress
+        if fields & SPUN_UP:
+            status['spun_up'] = bool(spun_up)
+        if fields & HOSTNAME:
+            status['hostname'] = hostname.rstrip(b'\0').decode()
+        seqs[run_num] = max(seqs.get(run_num, 0), seq)
+
+
+def _compact(path: str, fd: int) -> None:
+    next_seq, num_records, _ = _read_header(fd)
+    statuses, seqs = dict(), dict()
+    _merge(statuses, seqs, os.pread(fd, num_records * _RECORD.size, _HEADER.size), num_records)
+    records = [_pack_record(seqs[run_num], run_num, PROGRESS | SPUN_UP | HOSTNAME, **status)
+               for run_num, status in sorted(statuses.items())]
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, next_seq, len(records), len(records)))
+        f.write(b''.join(records))
+    os.rename(tmp_path, path)
+
+
+def _pack_record(
+        seq: int,
+        run_num: int,
+        fields: int,
+        progress: Optional[float] = None,
+        spun_up: Optional[bool] = None,
+        hostname: Optional[str] = None,
+) -> bytes:
+    return _RECORD.pack(seq, run_num, fields, progress or 0.0, int(bool(spun_up)), (hostname or '').encode()[:64])
+
+
+def update(
+        xid_dir: str,
+        run_num: int,
+        progress: Optional[float] = None,
+        spun_up: Optional[bool] = None,
+        hostname: Optional[str] = None,
+) -> int:
+    fields = ((PROGRESS if progress is not None else 0) | (SPUN_UP if spun_up is not None else 0)
+              | (HOSTNAME if hostname is not None else 0))
+    path = status_path(xid_dir)
+    fd = _open_locked(path)
+    try:
+        next_seq, num_records, compacted_records = _read_header(fd)
+        record = _pack_record(next_seq, run_num, fields, progress, spun_up, hostname)
+        os.pwrite(fd, record, _HEADER.size + num_records * _RECORD.size)
+        os.pwrite(fd, _HEADER.pack(_MAGIC, _VERSION, next_seq + 1, num_records + 1, compacted_records), 0)
+        if num_records + 1 > 2 * compacted_records + 1024:
+            _compact(path, fd)
+        return next_seq
+    finally:
+        os.close(fd)
+
+
+def read(xid_dir: str, since: int = 0) -> Tuple[int, Mapping[int, RunStatus]]:
+    # returns the index version and the status of every run changed after version `since`.
+    path = status_path(xid_dir)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        header = os.pread(fd, _HEADER.size, 0)
+        if len(header) < _HEADER.size:
+            return 0, dict()
+        magic, version, next_seq, num_records, _ = _HEADER.unpack(header)
+        if magic != _MAGIC or version != _VERSION:
+            raise Exception(f'{path} is not a version {_VERSION} status index.')
+        if next_seq - 1 == since:
+            return since, dict()
+        data = os.pread(fd, num_records * _RECORD.size, _HEADER.size)
+    finally:
+        os.close(fd)
+    # records only set some fields, so a changed run's status is merged from all of its records,
+    # but the records of runs that did not change are skipped.
+    records = np.frombuffer(data, dtype=_RECORD_DTYPE, count=len(data) // _RECORD.size)
+    if since > 0:
+        records = records[np.isin(records['run_num'], records['run_num'][records['seq'] > since])]
+    statuses, seqs = dict(), dict()
+    _merge(statuses, seqs, records.tobytes(), len(records))
+    return next_seq - 1, statuses
+
+
+def exists(xid_dir: str) -> bool:
+    return os.path.isfile(status_path(xid_dir))